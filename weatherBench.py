@@ -0,0 +1,311 @@
+#!/usr/bin/python3.7
+# Benchmark of the plot data and graph paths on a synthetic weewx database.
+#
+#   python3 weatherBench.py --db /tmp/bench.sdb --years 2 --interval 5 --output bench.json
+#
+# The database is generated if it does not exist (or with --generate).  Results are written as
+# JSON so runs on different commits can be compared.
+import argparse, datetime, json, os, platform, subprocess, sys, time
+import sqlite3
+import numpy as np
+from weatherStats import PlotStep, CalcType, WeatherPlotter, epochToLocal, rollingCalcTypes
+from weatherHistogram import directionBins, valueBins
+
+observations = ['outTemp', 'outHumidity', 'windSpeed', 'windDir', 'windGust', 'rain', 'rainRate']
+units = {"outTemp": "deg F", "outHumidity": "%", "windSpeed": "mph", "windDir": "deg", "windGust": "mph", "rain": "in", "rainRate": "in/hr"}
+
+# Time span requested for each plot step, ending at the last record of the database (days)
+benchSpans = {PlotStep.ALL: 7, PlotStep.FIVE_MINUTE: 7, PlotStep.FIFTEEN_MINUTE: 14, PlotStep.HOURLY: 30, PlotStep.THREE_HOURLY: 90, PlotStep.DAILY: 365,
+    PlotStep.WEEKLY: 365 * 2, PlotStep.MONTHLY: 365 * 5, PlotStep.QUARTERLY: 365 * 5, PlotStep.SEASONALLY: 365 * 5, PlotStep.ANNUALLY: 365 * 10}
+
+# Calculation types of the standard (getData) requests, the other types have their own plot requests
+aggregateCalcTypes = (CalcType.MIN, CalcType.MAX, CalcType.SUM, CalcType.AVG)
+
+# Settings of the derived plot requests, the same as the dashboard (wxStats.py)
+rollingWindow = 86400.0
+degreeDayBase = 65.0
+windRoseSpeeds = (0, 1, 4, 8, 13, 19, 25, np.inf)
+
+
+def smoothNoise(rng, times, period, scale):
+    # Random values that change smoothly over the period (seconds)
+    knots = np.arange(times[0], times[-1] + 2 * period, period)
+    return np.interp(times, knots, rng.normal(0.0, scale, len(knots)))
+
+def createWeather(times, interval, rng):
+    # Synthetic observations with daily and seasonal cycles, wind calms, and rain storms
+    local = epochToLocal(times)
+    dayOfYear = (local - local.astype('datetime64[Y]')).astype('timedelta64[s]').astype(float) / 86400.0
+    hourOfDay = (local - local.astype('datetime64[D]')).astype('timedelta64[s]').astype(float) / 3600.0
+    n = len(times)
+
+    data = dict()
+    dailySwing = 8.0 + smoothNoise(rng, times, 86400, 3.0)
+    data['outTemp'] = 55.0 - 20.0 * np.cos(2 * np.pi * (dayOfYear - 15) / 365.25) - dailySwing * np.cos(2 * np.pi * (hourOfDay - 3) / 24.0) + smoothNoise(rng, times, 3 * 86400, 6.0) + rng.normal(0.0, 0.3, n)
+    data['outHumidity'] = np.clip(65.0 - 1.5 * (data['outTemp'] - 55.0) + smoothNoise(rng, times, 43200, 12.0), 5.0, 100.0)
+
+    wind = np.clip(5.0 + smoothNoise(rng, times, 7200, 4.0) + rng.gamma(1.5, 1.5, n) - 2.0, 0.0, None)
+    data['windSpeed'] = np.round(wind, 1)
+    data['windGust'] = np.round(wind * rng.uniform(1.2, 1.8, n) + rng.gamma(1.0, 1.0, n) * (wind > 0), 1)
+    data['windDir'] = np.mod(np.cumsum(rng.normal(0.0, 8.0, n)), 360.0)
+    data['windDir'][data['windSpeed'] == 0.0] = np.nan # no direction in calm air
+
+    # Storms start on about a third of the days and rain at a varying rate
+    numStorms = int((times[-1] - times[0]) / 86400 * 0.3) + 1
+    stormStarts = np.sort(rng.uniform(times[0], times[-1], numStorms))
+    stormEnds = stormStarts + rng.gamma(2.0, 2.0, numStorms) * 3600
+    stormIndex = np.searchsorted(stormStarts, times, side='right') - 1
+    raining = (stormIndex >= 0) & (times < stormEnds[np.maximum(stormIndex, 0)])
+    rate = np.where(raining, rng.gamma(1.2, 0.15, n), 0.0)
+    tips = np.diff(np.floor(np.cumsum(rate * interval / 3600.0) / 0.01), prepend=0.0) # 0.01 in tipping bucket
+    data['rain'] = np.round(tips * 0.01, 2)
+    data['rainRate'] = np.round(np.where(data['rain'] > 0, rate, 0.0), 2)
+
+    return data
+
+def addGaps(times, data, interval, rng, outages, dropouts, nullFraction):
+    # Remove records for station outages and add NULL runs for sensor dropouts and single NULLs
+    keep = np.ones(len(times), dtype=bool)
+    for start in rng.integers(0, len(times), outages):
+        keep[start:start + int(rng.gamma(2.0, 6.0) * 3600 / interval)] = False
+    for entry in data:
+        for start in rng.integers(0, len(times), dropouts):
+            data[entry][start:start + int(rng.gamma(1.5, 2.0) * 3600 / interval)] = np.nan
+        data[entry][rng.random(len(times)) < nullFraction] = np.nan
+
+    return times[keep], {entry: values[keep] for entry, values in data.items()}
+
+def dailySummaries(times, values, interval):
+    # weewx daily summary rows (dateTime, min, mintime, max, maxtime, sum, count, wsum, sumtime)
+    # of each local day
+    days = epochToLocal(times).astype('datetime64[D]')
+    uniqueDays, dayStarts, dayIndex = np.unique(days, return_index=True, return_inverse=True)
+    dayTimes = [int(datetime.datetime.combine(day.astype(datetime.date), datetime.time()).timestamp()) for day in uniqueDays]
+
+    isValid = ~np.isnan(values)
+    counts = np.add.reduceat(isValid.astype('int64'), dayStarts)
+    sums = np.add.reduceat(np.where(isValid, values, 0.0), dayStarts)
+    wsums = np.add.reduceat(np.where(isValid, values * interval, 0.0), dayStarts)
+    sumtimes = np.add.reduceat(isValid * interval, dayStarts)
+
+    # First record of each day after sorting by value gives the min (NaN sorts last)
+    minOrder = np.lexsort((np.where(isValid, values, np.inf), dayIndex))
+    maxOrder = np.lexsort((np.where(isValid, -values, np.inf), dayIndex))
+    starts = np.searchsorted(dayIndex[minOrder], np.arange(len(uniqueDays)))
+    minIndex = minOrder[starts]
+    maxIndex = maxOrder[starts]
+
+    rows = []
+    for i in range(len(uniqueDays)):
+        if (counts[i] == 0):
+            rows.append((dayTimes[i], None, None, None, None, 0.0, 0, 0.0, 0))
+        else:
+            rows.append((dayTimes[i], float(values[minIndex[i]]), int(times[minIndex[i]]), float(values[maxIndex[i]]), int(times[maxIndex[i]]), float(sums[i]), int(counts[i]), float(wsums[i]), int(sumtimes[i])))
+    return rows
+
+def createDatabase(dbPath, years=1.0, interval=5, startTime=None, outagesPerYear=6, dropoutsPerYear=12, nullFraction=0.002, seed=1):
+    # Create weewx schema database (archive and archive_day_* tables) with records every interval
+    # minutes starting at startTime (local midnight one year before the current year by default)
+    if (startTime is None):
+        startTime = datetime.datetime(datetime.date.today().year - 1, 1, 1)
+    intervalSeconds = int(interval * 60)
+    startEpoch = int(startTime.timestamp()) // intervalSeconds * intervalSeconds
+    times = np.arange(startEpoch, startEpoch + int(years * 365.25 * 86400), intervalSeconds, dtype='int64')
+
+    rng = np.random.default_rng(seed)
+    data = createWeather(times, intervalSeconds, rng)
+    times, data = addGaps(times, data, intervalSeconds, rng, int(outagesPerYear * years), int(dropoutsPerYear * years), nullFraction)
+
+    if (os.path.exists(dbPath)):
+        os.remove(dbPath)
+    conn = sqlite3.connect(dbPath)
+    conn.execute('CREATE TABLE archive (dateTime INTEGER NOT NULL UNIQUE PRIMARY KEY, usUnits INTEGER NOT NULL, interval INTEGER NOT NULL, {})'.format(', '.join("{} REAL".format(entry) for entry in observations)))
+    columns = [times.tolist(), [1] * len(times), [int(interval)] * len(times)] + [np.where(np.isnan(data[entry]), None, data[entry]).tolist() for entry in observations]
+    conn.executemany('INSERT INTO archive VALUES ({})'.format(', '.join('?' * len(columns))), zip(*columns))
+
+    for entry in observations:
+        conn.execute('CREATE TABLE archive_day_{} (dateTime INTEGER NOT NULL UNIQUE PRIMARY KEY, min REAL, mintime INTEGER, max REAL, maxtime INTEGER, sum REAL, count INTEGER, wsum REAL, sumtime INTEGER)'.format(entry))
+        conn.executemany('INSERT INTO archive_day_{} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(entry), dailySummaries(times, data[entry], intervalSeconds))
+    conn.commit()
+    conn.close()
+
+    return len(times)
+
+def timeCall(function, repeat):
+    # Run function repeat times, returns timings (seconds) and the first result
+    timings = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = function()
+        timings.append(time.perf_counter() - start)
+        if (i == 0):
+            result = output
+    return timings, result
+
+def benchCase(results, name, function, repeat, points=None, **info):
+    # Time one case and add it to the results, errors are recorded instead of stopping the run
+    case = dict(name=name, **info)
+    try:
+        timings, output = timeCall(function, repeat)
+        case.update({'first': timings[0], 'min': min(timings), 'median': float(np.median(timings)), 'repeat': repeat, 'error': None})
+        if (points is not None):
+            case['points'] = points(output)
+    except Exception as error:
+        case.update({'first': None, 'min': None, 'median': None, 'repeat': repeat, 'error': "{}: {}".format(type(error).__name__, error)})
+    results.append(case)
+    print("{:<16} {:<40} {}".format(name, " ".join(str(value) for value in info.values()), "error: " + case['error'] if case['error'] else "{:.4f} s".format(case['min'])), file=sys.stderr)
+
+def getSpan(plotter, step):
+    latestTime = plotter.getLatestTime()
+    firstTime = plotter.getFromDatabase('SELECT MIN(dateTime) FROM archive')[0][0]
+    endTime = datetime.datetime.fromtimestamp(latestTime)
+    startTime = max(endTime - datetime.timedelta(days=benchSpans[step]), datetime.datetime.fromtimestamp(firstTime))
+    return startTime, endTime
+
+def getCalcCases(entries):
+    # (calculation type, entry) pairs to benchmark.  STATS is the temperature summary plot and
+    # degree days and wind roses use fixed observations, so these run once instead of per entry.
+    for calcType in CalcType:
+        if (calcType == CalcType.STATS):
+            yield calcType, 'outTemp'
+        elif (calcType in (CalcType.HEATING_DEGREE_DAYS, CalcType.COOLING_DEGREE_DAYS, CalcType.WIND_ROSE)):
+            yield calcType, entries[0]
+        else:
+            for entry in entries:
+                yield calcType, entry
+
+def getPlotRequest(calcType, entry, startTime, endTime, step):
+    # Graph request of a calculation type, built the way the dashboard builds custom graph requests
+    request = {'startTime': startTime, 'endTime': endTime}
+    if (calcType == CalcType.STATS):
+        request.update({'type': "tempPlot", 'data_type': 'outTemp', 'plotStep': step, 'maxPoints': 2000})
+    elif (calcType == CalcType.CUMSUM):
+        request.update({'type': "rolling", 'data_type': entry, 'operator': 'cumsum', 'resetStep': step, 'maxPoints': 2000})
+    elif (calcType in rollingCalcTypes):
+        request.update({'type': "rolling", 'data_type': entry, 'operator': rollingCalcTypes[calcType], 'window': rollingWindow, 'resetStep': step, 'maxPoints': 2000})
+    elif (calcType in (CalcType.HEATING_DEGREE_DAYS, CalcType.COOLING_DEGREE_DAYS)):
+        kind = 'heating' if calcType == CalcType.HEATING_DEGREE_DAYS else 'cooling'
+        request.update({'type': "degreeDays", 'data_type': 'outTemp', 'kind': kind, 'base': degreeDayBase, 'resetStep': step})
+    elif (calcType == CalcType.WIND_ROSE):
+        request.update({'type': "windRose", 'data_type': 'windSpeed', 'xEntry': 'windDir', 'yEntry': 'windSpeed', 'xBins': directionBins(16), 'yBins': valueBins(windRoseSpeeds)})
+    else:
+        request.update({'type': "standard", 'data_type': entry, 'plotStep': step, 'calcType': calcType, 'maxPoints': 2000})
+    return request
+
+def runBenchmark(dbPath, repeat=3, entries=('outTemp', 'rain'), rollupPath=None, columnDir=None, updateGraph=True):
+    results = []
+    setup = dict()
+
+    # Sidecar stores are built on first use, time that separately
+    start = time.perf_counter()
+    plotter = WeatherPlotter(dbPath, units, rollupPath=rollupPath, columnDir=columnDir)
+    if (plotter.rollups is not None):
+        plotter.rollups.update()
+    if (plotter.columns is not None):
+        plotter.columns.refresh()
+    setup['plotter'] = time.perf_counter() - start
+
+    for step in PlotStep:
+        startTime, endTime = getSpan(plotter, step)
+        span = {'plotStep': step.name, 'days': round((endTime - startTime).total_seconds() / 86400, 2)}
+        for calcType in aggregateCalcTypes:
+            for entry in entries:
+                benchCase(results, 'getData', lambda: plotter.getData(entry, startTime, endTime, step, calcType), repeat, lambda output: len(output[1]), entry=entry, calcType=calcType.name, **span)
+        benchCase(results, 'getTempPlotData', lambda: plotter.getTempPlotData(startTime, endTime, step), repeat, lambda output: len(output[1]), **span)
+
+        # Running totals, rolling windows, degree days, and wind roses through their own plot requests
+        for calcType, entry in getCalcCases(entries):
+            if (calcType not in aggregateCalcTypes and calcType != CalcType.STATS):
+                plotRequest = getPlotRequest(calcType, entry, startTime, endTime, step)
+                benchCase(results, 'calcPlotRequest', lambda: plotter.calcPlotRequest(plotRequest), repeat, lambda output: output['reduction']['points'], entry=plotRequest['data_type'], calcType=calcType.name, **span)
+
+        # Graph creation from plot data already calculated
+        for calcType in CalcType:
+            plotRequest = getPlotRequest(calcType, entries[0], startTime, endTime, step)
+            try:
+                graphData = plotter.getPlotData(plotRequest)
+            except Exception as error:
+                graphData = None
+            if (graphData is not None):
+                benchCase(results, 'createGraph', lambda: plotter.createGraph(graphData), repeat, entry=plotRequest['data_type'], calcType=calcType.name, **span)
+
+    startTime, endTime = getSpan(plotter, PlotStep.ALL)
+    benchCase(results, 'getRainPlotData', lambda: plotter.getRainPlotData(startTime, endTime), repeat, lambda output: len(output['rainSum'][1]), plotStep=PlotStep.ALL.name)
+
+    # Wind rose of the whole archive, later repeats use the cached counts of the closed months
+    firstTime = plotter.getFromDatabase('SELECT MIN(dateTime) FROM archive')[0][0]
+    latestTime = plotter.getLatestTime()
+    benchCase(results, 'getHistogram', lambda: plotter.getHistogram('windDir', 'windSpeed', firstTime, latestTime + 1, directionBins(16), valueBins((0, 1, 4, 8, 13, 19, 25, np.inf))), repeat,
+        lambda output: int(output['counts'].sum()), days=round((latestTime - firstTime) / 86400, 2))
+
+    if (updateGraph):
+        setup['updateGraph'] = benchUpdateGraph(results, dbPath, repeat, entries)
+
+    return {'setup': setup, 'results': results}
+
+def benchUpdateGraph(results, dbPath, repeat, entries):
+    # End to end custom graph requests through the dashboard module (plot workers, plot data cache,
+    # and figure serialization), the first call is uncached
+    os.environ['WXDASH_DB'] = dbPath
+    start = time.perf_counter()
+    try:
+        import wxStats
+        import plotly
+    except ImportError as error:
+        return {'error': "{}: {}".format(type(error).__name__, error)}
+    importTime = time.perf_counter() - start
+
+    for step in PlotStep:
+        startTime, endTime = getSpan(wxStats.weatherPlot, step)
+        span = {'plotStep': step.name, 'days': round((endTime - startTime).total_seconds() / 86400, 2)}
+        for calcType, entry in getCalcCases(entries):
+            def updateGraph():
+                fig = wxStats.create_custom_graph(startTime.strftime("%Y-%m-%d"), endTime.strftime("%Y-%m-%d"), entry, startTime.strftime("%H:%M:%S"), endTime.strftime("%H:%M:%S"), calcType.name, step.name)
+                return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder) # as sent by Dash
+            benchCase(results, 'update_graph', updateGraph, repeat, lambda output: len(output), entry=entry, calcType=calcType.name, **span)
+
+    return {'import': importTime}
+
+def getCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description="Benchmark weather plot data and graphs on a synthetic weewx database")
+    parser.add_argument('--db', default="bench_weewx.sdb", help="database path, generated if it does not exist")
+    parser.add_argument('--generate', action='store_true', help="regenerate the database")
+    parser.add_argument('--years', type=float, default=1.0, help="years of generated data")
+    parser.add_argument('--interval', type=float, default=5, help="minutes between generated records")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help="calls timed for each case")
+    parser.add_argument('--rollups', action='store_true', help="use a rollup database next to the database")
+    parser.add_argument('--columns', action='store_true', help="use a column store next to the database")
+    parser.add_argument('--no-update-graph', dest='updateGraph', action='store_false', help="skip end to end dashboard requests")
+    parser.add_argument('--output', help="JSON results path (default stdout)")
+    args = parser.parse_args()
+
+    database = {'path': args.db}
+    if (args.generate or not os.path.exists(args.db)):
+        start = time.perf_counter()
+        database['records'] = createDatabase(args.db, args.years, args.interval, seed=args.seed)
+        database.update({'years': args.years, 'interval': args.interval, 'seed': args.seed, 'generateTime': time.perf_counter() - start})
+    else:
+        conn = sqlite3.connect(args.db)
+        database['records'] = conn.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+        conn.close()
+
+    dbDir = os.path.dirname(os.path.abspath(args.db))
+    rollupPath = os.path.join(dbDir, "bench_rollup.sdb") if args.rollups else None
+    columnDir = os.path.join(dbDir, "bench_columns") if args.columns else None
+    report = runBenchmark(args.db, args.repeat, rollupPath=rollupPath, columnDir=columnDir, updateGraph=args.updateGraph)
+    report.update({'commit': getCommit(), 'time': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'numpy': np.__version__, 'database': database})
+
+    if (args.output):
+        with open(args.output, 'w') as outFile:
+            json.dump(report, outFile, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
@@ -0,0 +1,95 @@
+import time
+import numpy as np
+
+# Calendar step units, in the order of their length
+calendarUnits = ('minute', 'hour', 'day', 'week', 'month', 'quarter', 'season', 'year')
+
+# Months per step and the month of year (0 = January) steps are aligned to
+monthUnits = {'month': (1, 0), 'quarter': (3, 0), 'season': (3, 11), 'year': (12, 0)} # meteorological seasons start in December
+
+
+def utcOffsets(epochSeconds):
+    # UTC offset (seconds) of each epoch time.  The offset is looked up once per distinct day, and
+    # per point only within days where the offset changes.
+    seconds = np.floor(np.asarray(epochSeconds, dtype=float)).astype('int64')
+    if (len(seconds) == 0):
+        return np.zeros(0, dtype='int64')
+
+    days, dayIndex = np.unique(seconds // 86400, return_inverse=True)
+    startOffsets = np.array([time.localtime(day * 86400).tm_gmtoff for day in days])
+    endOffsets = np.array([time.localtime(day * 86400 + 86399).tm_gmtoff for day in days])
+    offsets = startOffsets[dayIndex]
+    changing = np.nonzero((startOffsets != endOffsets)[dayIndex])[0]
+    offsets[changing] = [time.localtime(t).tm_gmtoff for t in seconds[changing]]
+
+    return offsets
+
+def epochToLocal(epochTimes):
+    # Convert epoch times to a local time datetime64[s] array in one pass
+    seconds = np.floor(np.asarray(epochTimes, dtype=float)).astype('int64')
+    return (seconds + utcOffsets(seconds)).astype('datetime64[s]')
+
+def localToEpoch(localTimes):
+    # Epoch seconds of local wall clock times (datetime64).  The offset of the wall clock time read
+    # as UTC is refined once with the offset at the first estimate, which settles every time other
+    # than those skipped or repeated by a DST change (those map to one of the nearby instants).
+    local = np.asarray(localTimes, dtype='datetime64[s]').astype('int64')
+    epoch = local - utcOffsets(local)
+    return local - utcOffsets(epoch)
+
+def calendarEdges(startTimeEpoch, endTimeEpoch, unit, count=1):
+    # Edges of calendar steps covering [startTimeEpoch, endTimeEpoch) as epoch seconds.  The first
+    # edge is the start time and the last is the end time, the edges between are the local time
+    # step boundaries (e.g. local midnight for days, Monday for ISO weeks, the first of the month
+    # for months).  Steps that divide an hour are a fixed number of seconds, aligned to the local
+    # clock, so they stay uniform across DST changes.  Longer steps follow the local clock, so a
+    # day is 23 or 25 hours long on a DST change.
+    if (unit not in calendarUnits):
+        raise ValueError("Unknown calendar unit: {}".format(unit))
+    count = int(count)
+    local = epochToLocal([startTimeEpoch, endTimeEpoch])
+    startLocal, endLocal = local.astype('int64')
+
+    if (unit in ('minute', 'hour') and 3600 % (count * (60 if unit == 'minute' else 3600)) == 0):
+        # Fixed size steps in epoch time, whole hour offset changes keep them on the local boundaries
+        stepSize = count * (60 if unit == 'minute' else 3600)
+        offset = startLocal - int(np.floor(startTimeEpoch))
+        first = (startLocal // stepSize + 1) * stepSize - offset
+        boundaries = np.arange(first, endTimeEpoch, stepSize, dtype='int64')
+    else:
+        # Local clock boundaries, counted in the datetime64 unit of the step
+        if (unit in monthUnits):
+            monthsPerStep, alignMonth = monthUnits[unit]
+            stepUnits = monthsPerStep * count
+            startUnit, endUnit = local.astype('datetime64[M]').astype('int64')
+            first = (startUnit - alignMonth) // stepUnits * stepUnits + alignMonth
+            boundaries = np.arange(first, endUnit + 1, stepUnits).astype('datetime64[M]')
+        elif (unit in ('day', 'week')):
+            stepUnits = count * (7 if unit == 'week' else 1)
+            startUnit = startLocal // 86400
+            first = startUnit - (startUnit + 3) % 7 if unit == 'week' else startUnit // stepUnits * stepUnits # 1970-01-01 was a Thursday
+            boundaries = np.arange(first, endLocal // 86400 + 1, stepUnits).astype('datetime64[D]')
+        else: # minutes and hours that don't divide an hour (e.g. 3 hours), aligned to local midnight
+            stepUnits = count * (60 if unit == 'minute' else 3600)
+            boundaries = np.arange(startLocal // stepUnits * stepUnits, endLocal + 1, stepUnits).astype('datetime64[s]')
+        boundaries = np.unique(localToEpoch(boundaries))
+
+    boundaries = boundaries[(boundaries > startTimeEpoch) & (boundaries < endTimeEpoch)]
+    return np.concatenate(([startTimeEpoch], boundaries, [endTimeEpoch])).astype(float)
+
+def getUniformStep(edges):
+    # Step size if the calendar steps are evenly spaced in epoch time (the first and last steps may
+    # be partial), None otherwise.  Uniform steps can be grouped in the database.
+    if (len(edges) < 2):
+        return None
+    if (len(edges) == 2):
+        return float(edges[1] - edges[0]) if edges[1] > edges[0] else None
+    inner = np.diff(edges[1:-1])
+    stepSize = inner[0] if len(inner) else max(edges[1] - edges[0], edges[2] - edges[1])
+    if (np.all(inner == stepSize) and edges[1] - edges[0] <= stepSize and edges[-1] - edges[-2] <= stepSize):
+        return float(stepSize)
+    return None
+
+def getStepAnchor(edges, stepSize):
+    # Time the uniform steps count from, step i of (dateTime - anchor) // stepSize is edges[i]
+    return edges[1] - stepSize if len(edges) > 2 else edges[0]
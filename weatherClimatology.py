@@ -0,0 +1,202 @@
+import os, datetime, warnings
+import numpy as np
+from threading import Lock
+from weatherCalendar import epochToLocal
+
+# Day of year slot of the first day of each month, slots follow a leap year so each calendar day
+# has the same slot every year (February 29 has its own slot)
+monthSlots = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+numDaySlots = 366
+
+# Percentiles of the daily means kept for each day of year
+percentiles = (10, 25, 50, 75, 90)
+
+# Daily values kept for each year (rows of the day arrays) and hour of day sums (rows of the hour arrays)
+dayValues = ('min', 'max', 'mean', 'sum')
+hourValues = ('sum', 'count', 'min', 'max')
+
+
+def getDaySlots(localTimes):
+    # Day of year slot (0-365) of local times
+    days = np.asarray(localTimes).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    dayOfMonth = (days - months.astype('datetime64[D]')).astype('int64')
+    return monthSlots[months.astype('int64') % 12] + dayOfMonth
+
+
+class ClimatologyStore():
+    # Day of year and hour of day climatology of archive observations kept in a .npz file.  For each
+    # observation the daily min, max, mean (time weighted), and sum from the archive_day_* tables
+    # are stored as years x 366 arrays, and the sum, count, min, and max of the archive records as
+    # 12 x 24 (month x hour of day) arrays.  Both are updated incrementally with the days and
+    # records written since the last update.  Normals (mean, percentiles, mean high and low) and
+    # records (with their year) of each day of year are calculated from the arrays when they
+    # change, so requests only index them.  Only complete days are included.
+    def __init__(self, dbPool, climatePath, observations=('outTemp', 'outHumidity', 'windSpeed', 'windGust', 'rain')):
+        self.dbPool = dbPool # weewx database connections
+        self.climatePath = climatePath
+        self.observations = list(observations)
+
+        self.lock = Lock()
+        self.arrays = None # stored arrays
+        self.stats = dict() # day of year statistics of each observation
+        self.checkedDate = None # local date of the last update
+
+    def load(self):
+        if (self.arrays is not None):
+            return
+        self.arrays = dict()
+        if (os.path.exists(self.climatePath)):
+            with np.load(self.climatePath) as stored:
+                self.arrays = {name: stored[name] for name in stored.files}
+        for entry in self.observations:
+            self.calcStats(entry)
+
+    def save(self):
+        tmpPath = self.climatePath + ".tmp.npz"
+        np.savez(tmpPath, **self.arrays)
+        os.replace(tmpPath, self.climatePath)
+
+    def refresh(self):
+        # Update once per local day, the climatology only changes when a day is complete
+        today = datetime.date.today()
+        if (self.checkedDate != today):
+            self.update()
+            self.checkedDate = today
+
+    def update(self):
+        # Add days and archive records written since the last update
+        with self.lock:
+            self.load()
+            changed = False
+            with self.dbPool.connection() as conn:
+                tables = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+                for entry in self.observations:
+                    if ("archive_day_{}".format(entry) in tables):
+                        changed |= self.updateDays(conn, entry)
+                changed |= self.updateHours(conn, [entry for entry in self.observations if "archive_day_{}".format(entry) in tables])
+            if (changed):
+                self.save()
+
+    def updateDays(self, conn, entry):
+        # Store the daily values of days completed since the last update
+        table = "archive_day_{}".format(entry)
+        latestDay = conn.execute('SELECT MAX(dateTime) FROM {}'.format(table)).fetchone()[0]
+        lastDay = self.arrays.get("{}_lastDay".format(entry))
+        if (latestDay is None):
+            return False
+        dbRequest = 'SELECT dateTime, min, max, sum, count, wsum, sumtime FROM {} WHERE dateTime > ? AND dateTime < ? ORDER BY dateTime'.format(table)
+        dataArray = np.array(conn.execute(dbRequest, (int(lastDay) if lastDay is not None else -1, latestDay)).fetchall(), dtype=float).reshape(-1, 7)
+        if (len(dataArray) == 0):
+            return False
+
+        local = epochToLocal(dataArray[:,0])
+        years = local.astype('datetime64[Y]').astype('int64') + 1970
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(dataArray[:,6] > 0, dataArray[:,5] / dataArray[:,6], dataArray[:,3] / dataArray[:,4])
+
+        # Add rows for new years
+        days = self.arrays.get("{}_day".format(entry))
+        firstYear = int(self.arrays.get("{}_firstYear".format(entry), years[0]))
+        numYears = int(years[-1]) - firstYear + 1
+        if (days is None):
+            days = np.full((len(dayValues), numYears, numDaySlots), np.nan, dtype='float32')
+        elif (days.shape[1] < numYears):
+            days = np.concatenate((days, np.full((len(dayValues), numYears - days.shape[1], numDaySlots), np.nan, dtype='float32')), axis=1)
+
+        yearIndex = years - firstYear
+        slots = getDaySlots(local)
+        for i, values in enumerate((dataArray[:,1], dataArray[:,2], means, dataArray[:,3])):
+            days[i, yearIndex, slots] = values
+
+        self.arrays["{}_day".format(entry)] = days
+        self.arrays["{}_firstYear".format(entry)] = np.array(firstYear)
+        self.arrays["{}_lastDay".format(entry)] = np.array(int(dataArray[-1,0]))
+        self.calcStats(entry)
+        return True
+
+    def updateHours(self, conn, entries, chunkSize=65536):
+        # Add archive records written since the last update to the month x hour of day sums
+        if (not entries):
+            return False
+        lastTime = self.arrays.get('lastArchiveTime')
+        latestTime = conn.execute('SELECT MAX(dateTime) FROM archive').fetchone()[0]
+        if (latestTime is None or (lastTime is not None and latestTime <= lastTime)):
+            return False
+
+        hours = {entry: self.arrays.get("{}_hour".format(entry)) for entry in entries}
+        for entry in entries:
+            if (hours[entry] is None): # sums and counts start at zero, min and max at NaN
+                hours[entry] = np.zeros((len(hourValues), 12, 24))
+                hours[entry][2:] = np.nan
+
+        dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime > ? AND dateTime <= ? ORDER BY dateTime'.format(', '.join(entries))
+        cursor = conn.execute(dbRequest, (int(lastTime) if lastTime is not None else -1, latestTime))
+        while (True):
+            rows = cursor.fetchmany(chunkSize)
+            if (not rows):
+                break
+            dataArray = np.array(rows, dtype=float).reshape(-1, len(entries) + 1)
+            local = epochToLocal(dataArray[:,0])
+            month = local.astype('datetime64[M]').astype('int64') % 12
+            hour = (local - local.astype('datetime64[D]')).astype('timedelta64[h]').astype('int64')
+            bins = month * 24 + hour
+            for i, entry in enumerate(entries):
+                values = dataArray[:,i+1]
+                isValid = ~np.isnan(values)
+                hourArray = hours[entry].reshape(len(hourValues), -1)
+                hourArray[0] += np.bincount(bins[isValid], weights=values[isValid], minlength=12 * 24)
+                hourArray[1] += np.bincount(bins[isValid], minlength=12 * 24)
+                np.fmin.at(hourArray[2], bins[isValid], values[isValid])
+                np.fmax.at(hourArray[3], bins[isValid], values[isValid])
+
+        for entry in entries:
+            self.arrays["{}_hour".format(entry)] = hours[entry]
+        self.arrays['lastArchiveTime'] = np.array(latestTime)
+        return True
+
+    def calcStats(self, entry):
+        # Normals and records of each day of year from the yearly daily values
+        days = self.arrays.get("{}_day".format(entry))
+        if (days is None):
+            return
+        firstYear = int(self.arrays["{}_firstYear".format(entry)])
+        mins, maxs, means, sums = days.astype(float)
+
+        with warnings.catch_warnings(): # days of year without data are NaN
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            stats = {'mean': np.nanmean(means, axis=0), 'low': np.nanmean(mins, axis=0), 'high': np.nanmean(maxs, axis=0), 'sum': np.nanmean(sums, axis=0),
+                'recordHigh': np.nanmax(maxs, axis=0), 'recordLow': np.nanmin(mins, axis=0), 'years': np.sum(~np.isnan(means), axis=0)}
+            for percent, values in zip(percentiles, np.nanpercentile(means, percentiles, axis=0)):
+                stats['p{}'.format(percent)] = values
+
+        # Year of each record, the first year it was set
+        stats['recordHighYear'] = np.where(np.isnan(stats['recordHigh']), np.nan, firstYear + np.argmax(np.nan_to_num(maxs, nan=-np.inf), axis=0))
+        stats['recordLowYear'] = np.where(np.isnan(stats['recordLow']), np.nan, firstYear + np.argmin(np.nan_to_num(mins, nan=np.inf), axis=0))
+
+        # Replaced rather than updated so callers holding the previous statistics are unaffected
+        self.stats[entry] = stats
+
+    def getNormals(self, entry, startTime, endTime):
+        # Normals and records of each local day from the start to the end time as the local
+        # midnight of each day and a dict of arrays (mean, low, high, sum, p<percent>, recordHigh,
+        # recordHighYear, recordLow, recordLowYear, years), None if there is no climatology for entry
+        self.refresh()
+        stats = self.stats.get(entry)
+        if (stats is None):
+            return None
+        days = np.arange(np.datetime64(startTime.date()), np.datetime64(endTime.date()) + 1)
+        slots = getDaySlots(days)
+
+        return days.astype('datetime64[s]'), {name: values[slots] for name, values in stats.items()}
+
+    def getHourlyNormals(self, entry, month):
+        # Mean, min, and max of each hour of day (0-23) in month (1-12), None if there is no
+        # climatology for entry
+        self.refresh()
+        hours = self.arrays.get("{}_hour".format(entry))
+        if (hours is None):
+            return None
+        sums, counts, mins, maxs = hours[:, month - 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {'mean': np.where(counts > 0, sums / counts, np.nan), 'min': mins, 'max': maxs}
@@ -0,0 +1,150 @@
+import os, json
+import numpy as np
+from threading import Lock
+try:
+    import fcntl # lock between processes sharing the store
+except ImportError:
+    fcntl = None
+
+# Significant digits held by the float32 columns
+float32Digits = 7
+
+
+def roundFloat32(values):
+    # Round values read or calculated from the float32 columns to the digits float32 holds, so a
+    # stored 0.01 (0.0099999998) is 0.01 again.  NaN values are kept.
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+        isFinite = np.isfinite(magnitude)
+        scale = 10.0 ** np.where(isFinite, float32Digits - 1 - magnitude, 0.0)
+        return np.where(isFinite, np.round(values * scale) / scale, values)
+
+
+class ColumnStore():
+    # Copy of the archive table stored as one memory mapped .npy file per column (dateTime as int64,
+    # observations as float32 with NaN for NULL).  New archive records are appended on refresh.
+    # Range queries are views of the memory maps, so processes reading the same store share the
+    # operating system page cache instead of each keeping their own copy.  Archive records are
+    # assumed to only be appended, records changed after they were copied are not updated.
+    def __init__(self, dbPool, columnDir, observations=('outTemp', 'outHumidity', 'windSpeed', 'windDir', 'windGust', 'rain', 'rainRate'), chunkSize=65536):
+        self.dbPool = dbPool # weewx database connections
+        self.columnDir = columnDir
+        self.observations = list(observations)
+        self.chunkSize = chunkSize # archive records read per fetch
+
+        self.lock = Lock()
+        self.meta = None # length, capacity, and lastDateTime of the column files
+        self.metaStat = None
+        self.columns = dict() # memory maps of each column
+        self.columnStats = dict()
+
+    def columnPath(self, name):
+        return os.path.join(self.columnDir, "{}.npy".format(name))
+
+    def metaPath(self):
+        return os.path.join(self.columnDir, "meta.json")
+
+    def loadMeta(self):
+        # Reload metadata and reopen any column files that were replaced by another process
+        try:
+            metaStat = os.stat(self.metaPath())
+        except FileNotFoundError:
+            self.meta = {'length': 0, 'capacity': 0, 'lastDateTime': None, 'observations': self.observations}
+            return
+        if (self.metaStat is not None and (metaStat.st_mtime_ns, metaStat.st_size, metaStat.st_ino) == self.metaStat):
+            return # unchanged
+
+        with open(self.metaPath()) as metaFile:
+            meta = json.load(metaFile)
+        if (meta.get('observations') != self.observations): # store was built for other columns
+            meta = {'length': 0, 'capacity': 0, 'lastDateTime': None, 'observations': self.observations}
+        self.meta = meta
+        self.metaStat = (metaStat.st_mtime_ns, metaStat.st_size, metaStat.st_ino)
+
+        for name in ['dateTime'] + self.observations:
+            path = self.columnPath(name)
+            if (not os.path.exists(path)):
+                continue
+            columnStat = os.stat(path)
+            if (self.columnStats.get(name) != columnStat.st_ino):
+                self.columns[name] = np.load(path, mmap_mode='r')
+                self.columnStats[name] = columnStat.st_ino
+
+    def writeMeta(self, meta):
+        tmpPath = self.metaPath() + ".tmp"
+        with open(tmpPath, 'w') as metaFile:
+            json.dump(meta, metaFile)
+        os.replace(tmpPath, self.metaPath())
+
+    def refresh(self):
+        # Append archive records newer than the last one stored
+        with self.lock:
+            os.makedirs(self.columnDir, exist_ok=True)
+            with open(os.path.join(self.columnDir, "columns.lock"), 'w') as lockFile:
+                if (fcntl is not None):
+                    fcntl.flock(lockFile, fcntl.LOCK_EX)
+                self.metaStat = None # another process may have written while waiting for the lock
+                self.loadMeta()
+                meta = dict(self.meta)
+
+                with self.dbPool.connection() as conn:
+                    latestTime = conn.execute('SELECT MAX(dateTime) FROM archive').fetchone()[0]
+                    if (latestTime is None or latestTime == meta['lastDateTime']):
+                        return
+
+                    dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime > ? ORDER BY dateTime'.format(', '.join(self.observations))
+                    cursor = conn.execute(dbRequest, (meta['lastDateTime'] if meta['lastDateTime'] is not None else -1,))
+                    while (True):
+                        rows = cursor.fetchmany(self.chunkSize)
+                        if (not rows):
+                            break
+                        self.appendRows(meta, np.array(rows, dtype=float).reshape(-1, len(self.observations) + 1))
+
+                self.writeMeta(meta)
+                self.loadMeta()
+
+    def appendRows(self, meta, dataArray):
+        length = meta['length']
+        needed = length + len(dataArray)
+        if (needed > meta['capacity']): # grow files, readers keep the old files until they reload
+            capacity = max(needed, 2 * meta['capacity'], self.chunkSize)
+            for name, dtype in [('dateTime', 'int64')] + [(entry, 'float32') for entry in self.observations]:
+                path = self.columnPath(name)
+                tmpPath = path + ".tmp"
+                newColumn = np.lib.format.open_memmap(tmpPath, mode='w+', dtype=dtype, shape=(capacity,))
+                if (length > 0):
+                    newColumn[:length] = self.columns[name][:length]
+                newColumn.flush()
+                del newColumn
+                os.replace(tmpPath, path)
+            meta['capacity'] = capacity
+            self.metaStat = None
+            self.columnStats = dict()
+            self.columns = {name: np.load(self.columnPath(name), mmap_mode='r') for name in ['dateTime'] + self.observations}
+
+        # Write new records after the existing ones
+        for i, name in enumerate(['dateTime'] + self.observations):
+            column = np.load(self.columnPath(name), mmap_mode='r+')
+            column[length:needed] = dataArray[:,i]
+            column.flush()
+            del column
+        meta['length'] = needed
+        meta['lastDateTime'] = int(dataArray[-1,0])
+
+    def getRange(self, entry, startTimeEpoch, endTimeEpoch):
+        # Times and values of the archive records between the start and end times (inclusive) as
+        # views of the memory mapped columns
+        self.refresh()
+        with self.lock:
+            self.loadMeta()
+            length = self.meta['length']
+            if (length == 0):
+                return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32')
+            times = self.columns['dateTime'][:length]
+            values = self.columns[entry][:length]
+
+        startIndex = np.searchsorted(times, startTimeEpoch, side='left')
+        endIndex = np.searchsorted(times, endTimeEpoch, side='right')
+
+        return times[startIndex:endIndex], values[startIndex:endIndex]
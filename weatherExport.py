@@ -0,0 +1,100 @@
+import numpy as np
+try:
+    import pyarrow as pa # Parquet and Arrow exports
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Export format -> (mime type, file extension)
+exportFormats = {'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')}
+
+
+def formatAvailable(exportFormat):
+    return exportFormat == 'csv' or (exportFormat in exportFormats and pa is not None)
+
+def iterCsv(chunks, columnNames):
+    # CSV text of (local times, {column: values}) chunks, one string per chunk.  Values are written
+    # as the shortest text that reads back as the same float, missing values (NaN) are left empty.
+    yield ",".join(['time'] + list(columnNames)) + "\n"
+    for times, columns in chunks:
+        if (len(times) == 0):
+            continue
+        fields = [np.datetime_as_string(np.asarray(times, dtype='datetime64[s]'), unit='s')]
+        for name in columnNames:
+            values = np.asarray(columns[name], dtype=float)
+            text = np.array([repr(value) for value in values.tolist()], dtype=object)
+            text[np.isnan(values)] = ''
+            fields.append(text)
+        yield "\n".join(",".join(row) for row in zip(*fields)) + "\n"
+
+
+class ChunkSink():
+    # Write only file that holds the bytes written by a pyarrow writer until they are taken, so
+    # the output can be streamed as it is written
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def getArrowBatch(times, columns, schema):
+    # Record batch of a chunk, NaN values are stored as nulls
+    arrays = [pa.array(np.asarray(times, dtype='datetime64[s]'), type=schema.field(0).type)]
+    arrays += [pa.array(np.asarray(columns[field.name], dtype=float), type=field.type, from_pandas=True) for field in list(schema)[1:]]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def iterArrow(chunks, columnNames, exportFormat):
+    # Parquet (one row group per chunk) or Arrow IPC stream bytes of (local times, {column: values})
+    # chunks, yielded as each chunk is written
+    if (pa is None):
+        raise RuntimeError("pyarrow is needed for {} exports".format(exportFormat))
+    schema = pa.schema([('time', pa.timestamp('s'))] + [(name, pa.float64()) for name in columnNames])
+    sink = ChunkSink()
+    if (exportFormat == 'parquet'):
+        writer = pq.ParquetWriter(sink, schema)
+        writeBatch = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        writeBatch = writer.write_batch
+
+    try:
+        for times, columns in chunks:
+            if (len(times) == 0):
+                continue
+            writeBatch(getArrowBatch(times, columns, schema))
+            data = sink.take()
+            if (data):
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+def iterExport(chunks, columnNames, exportFormat):
+    # Export of the chunks in the requested format
+    if (exportFormat == 'csv'):
+        return (text.encode() for text in iterCsv(chunks, columnNames))
+    return iterArrow(chunks, columnNames, exportFormat)
@@ -0,0 +1,92 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# Names of the 16 compass sectors, sector i is centered on i * 22.5 degrees
+cardinalNames = np.array(['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'])
+
+
+def directionBins(numSectors=16):
+    # Compass sectors centered on north, for directions in degrees
+    return ('sectors', int(numSectors))
+
+def valueBins(edges):
+    # Bins between edges, bin i covers [edges[i], edges[i+1]).  Use inf as the last edge to
+    # include all larger values.
+    return ('edges', tuple(float(edge) for edge in edges))
+
+def getNumBins(bins):
+    return bins[1] if bins[0] == 'sectors' else len(bins[1]) - 1
+
+def getBinIndex(values, bins):
+    # Bin of each value, -1 for NaN (NULL) and values outside the bins
+    values = np.asarray(values, dtype=float)
+    isValid = ~np.isnan(values)
+    if (bins[0] == 'sectors'):
+        width = 360.0 / bins[1]
+        index = np.floor(np.mod(np.where(isValid, values, 0.0) + width / 2, 360.0) / width).astype('int64') % bins[1]
+    else:
+        edges = np.asarray(bins[1])
+        index = np.searchsorted(edges, values, side='right') - 1
+        isValid &= (values >= edges[0]) & (values < edges[-1])
+    return np.where(isValid, index, -1)
+
+def getBinLabels(bins):
+    if (bins[0] == 'sectors'):
+        if (bins[1] == len(cardinalNames)):
+            return list(cardinalNames)
+        return ["{:g}".format(i * 360.0 / bins[1]) for i in range(bins[1])]
+    edges = bins[1]
+    return ["{:g}+".format(low) if np.isinf(high) else "{:g}-{:g}".format(low, high) for low, high in zip(edges[:-1], edges[1:])]
+
+def cardinalDirection(windDir):
+    # Compass sector name of a direction in degrees
+    return str(cardinalNames[getBinIndex([windDir], directionBins(len(cardinalNames)))[0]])
+
+def binCounts(segments, numSegments, xIndex, yIndex, numX, numY, directions=None):
+    # Counts of each (segment, x bin, y bin) from one bincount of the combined bin indices, points
+    # with any index of -1 are skipped.  With directions (degrees), also returns the sums of their
+    # sines and cosines for circular means.  Arrays are numSegments x numX x numY.
+    isValid = (segments >= 0) & (xIndex >= 0) & (yIndex >= 0)
+    combined = (segments[isValid] * numX + xIndex[isValid]) * numY + yIndex[isValid]
+    size = numSegments * numX * numY
+    counts = np.bincount(combined, minlength=size).reshape(numSegments, numX, numY)
+    if (directions is None):
+        return counts, None, None
+    radians = np.deg2rad(np.asarray(directions, dtype=float)[isValid])
+    sinSums = np.bincount(combined, weights=np.sin(radians), minlength=size).reshape(numSegments, numX, numY)
+    cosSums = np.bincount(combined, weights=np.cos(radians), minlength=size).reshape(numSegments, numX, numY)
+    return counts, sinSums, cosSums
+
+def circularMean(sinSums, cosSums):
+    # Mean direction (degrees, 0-360) from sums of sines and cosines, NaN without data
+    with np.errstate(invalid='ignore'):
+        mean = np.mod(np.rad2deg(np.arctan2(sinSums, cosSums)), 360.0)
+    mean = np.where(mean >= 360.0, 0.0, mean) # tiny negative angles round up to 360
+    return np.where((sinSums == 0) & (cosSums == 0), np.nan, mean)
+
+def createWindRoseFigure(histogram, xBins, yBins, title, speedUnits):
+    # Stacked barpolar wind rose, percent of the time from each direction for each speed bin.  The
+    # mean direction of each speed bin is shown when hovering.
+    counts = histogram['counts']
+    total = counts.sum()
+    percent = 100.0 * counts / total if total > 0 else np.zeros(counts.shape)
+    sectorNames = getBinLabels(xBins)
+    meanDirections = circularMean(histogram['sinSums'].sum(axis=0), histogram['cosSums'].sum(axis=0))
+
+    traces = []
+    for j, speedLabel in enumerate(getBinLabels(yBins)):
+        meanText = "--" if np.isnan(meanDirections[j]) else "{:.0f}{}".format(meanDirections[j], u'\N{DEGREE SIGN}')
+        traces.append(go.Barpolar(r=percent[:,j], theta=sectorNames, name=speedLabel,
+            hovertemplate="%{theta}: %{r:.1f}%<extra>" + "{} {} (mean direction {})".format(speedLabel, speedUnits, meanText) + "</extra>"))
+    fig = go.Figure(data=traces)
+    fig.update_layout(title=title, legend={'title': {'text': "Wind Speed ({})".format(speedUnits)}},
+        polar={'angularaxis': {'direction': 'clockwise', 'rotation': 90}, 'radialaxis': {'ticksuffix': '%'}}, margin={'t': 60})
+
+    return fig
+
+def createHeatmapFigure(histogram, xBins, yBins, title, xaxis_title, yaxis_title):
+    # Heatmap of the counts of each (x bin, y bin)
+    fig = go.Figure(data=[go.Heatmap(z=histogram['counts'].T, x=getBinLabels(xBins), y=getBinLabels(yBins), colorbar={'title': {'text': 'Count'}})])
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title=yaxis_title, margin={'t': 60})
+
+    return fig
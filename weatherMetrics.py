@@ -0,0 +1,102 @@
+import time, logging
+from threading import Lock
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds
+secondsBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+rowsBuckets = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+bytesBuckets = (1000, 10000, 100000, 1000000, 10000000, 100000000, 1000000000)
+
+
+class Histogram():
+    # Cumulative bucket counts, sum, and count of observed values for each set of label values
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = dict() # label items -> [bucket counts, sum, count]
+
+    def observe(self, value, labels):
+        series = self.series.get(labels)
+        if (series is None):
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if (value <= bound):
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        for labels, (bucketCounts, total, count) in sorted(self.series.items()):
+            labelText = ",".join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels)
+            prefix = labelText + "," if labelText else ""
+            for bound, bucketCount in zip(self.buckets, bucketCounts):
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(self.name, prefix, bound, bucketCount))
+            lines.append('{}_bucket{{{}le="+Inf"}} {}'.format(self.name, prefix, count))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, labelText, repr(total)))
+            lines.append('{}_count{{{}}} {}'.format(self.name, labelText, count))
+        return "\n".join(lines)
+
+
+class Metrics():
+    # Timing spans of plot requests.  Each span records its duration and, when set by the code in
+    # the span, the rows and bytes it handled.  Spans slower than slowTime (seconds) are logged
+    # along with their detail (e.g. the query plan of a database request).
+    def __init__(self, slowTime=None, prefix="wxdash"):
+        self.slowTime = slowTime
+        self.lock = Lock()
+        self.seconds = Histogram("{}_span_seconds".format(prefix), "Duration of timed spans", secondsBuckets)
+        self.rows = Histogram("{}_span_rows".format(prefix), "Rows or points handled by timed spans", rowsBuckets)
+        self.bytes = Histogram("{}_span_bytes".format(prefix), "Bytes produced by timed spans", bytesBuckets)
+        self.prefix = prefix
+        self.gauges = dict() # name -> (help, value or function returning the value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        # Time the enclosed code.  The yielded dict takes 'rows', 'bytes', and 'detail' (text or a
+        # function returning text, only used for slow spans).
+        span = dict()
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.observe(name, time.perf_counter() - start, span, **labels)
+
+    def observe(self, name, seconds, span, **labels):
+        # Record span timed elsewhere (e.g. between request hooks)
+        labelItems = (('span', name),) + tuple(sorted(labels.items()))
+        with self.lock:
+            self.seconds.observe(seconds, labelItems)
+            if (span.get('rows') is not None):
+                self.rows.observe(span['rows'], labelItems)
+            if (span.get('bytes') is not None):
+                self.bytes.observe(span['bytes'], labelItems)
+
+        if (self.slowTime is not None and seconds > self.slowTime):
+            self.logSlow(name, labels, span, seconds)
+
+    def logSlow(self, name, labels, span, seconds):
+        detail = span.get('detail')
+        try:
+            detail = detail() if callable(detail) else detail
+        except Exception as e: # detail is only informational
+            detail = "detail not available: {}".format(e)
+        logger.warning("Slow %s %s: %.3f s, rows %s, bytes %s%s", name, labels, seconds, span.get('rows', '-'), span.get('bytes', '-'), "\n" + detail if detail else "")
+
+    def setGauge(self, name, help, value):
+        # Current value, a function is called each time the metrics are rendered
+        with self.lock:
+            self.gauges["{}_{}".format(self.prefix, name)] = (help, value)
+
+    def render(self):
+        with self.lock:
+            lines = [histogram.render() for histogram in (self.seconds, self.rows, self.bytes)]
+            for name, (help, value) in sorted(self.gauges.items()):
+                value = value() if callable(value) else value
+                if (value is not None):
+                    lines.append("# HELP {0} {1}\n# TYPE {0} gauge\n{0} {2}".format(name, help, repr(float(value))))
+            return "\n".join(lines) + "\n"
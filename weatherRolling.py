@@ -0,0 +1,82 @@
+import numpy as np
+
+# Rolling window operators
+rollingOperators = ('sum', 'mean', 'min', 'max')
+
+
+def getSegmentStarts(times, resetEdges=None):
+    # Index of the first point of the segment each point is in.  Segments restart at each reset
+    # edge (e.g. local midnight), times and edges can be epoch times or datetime64.
+    numPoints = len(times)
+    if (resetEdges is None or len(resetEdges) == 0 or numPoints == 0):
+        return np.zeros(numPoints, dtype='int64')
+    segment = np.searchsorted(resetEdges, times, side='right')
+    isStart = np.empty(numPoints, dtype=bool)
+    isStart[0] = True
+    isStart[1:] = segment[1:] != segment[:-1]
+    return np.maximum.accumulate(np.where(isStart, np.arange(numPoints), 0))
+
+def cumulativeSum(times, values, resetEdges=None):
+    # Running total of the values in time order, restarting at each reset edge.  NaN (NULL) values
+    # add nothing.
+    totals = np.cumsum(np.nan_to_num(np.asarray(values, dtype=float)))
+    starts = getSegmentStarts(times, resetEdges)
+    return totals - np.concatenate(([0.0], totals))[starts]
+
+def getWindowStarts(times, window, resetEdges=None):
+    # Index of the first point in the window (t - window, t] of each point, windows don't reach back
+    # past a reset edge
+    times = np.asarray(times, dtype=float)
+    starts = np.searchsorted(times, times - window, side='right')
+    return np.maximum(starts, getSegmentStarts(times, resetEdges))
+
+def windowExtreme(values, starts, reduceFunc):
+    # Min or max (np.fmin or np.fmax) of values[starts[i]:i+1] for every point.  Uses a sparse table
+    # built one level at a time: level k holds the result over 2**k points from each index, and a
+    # window of length L is covered by two overlapping runs of the largest 2**k <= L.  Only the
+    # current level is kept, so memory stays O(n) and the time is O(n log(window points)).
+    numPoints = len(values)
+    result = np.full(numPoints, np.nan)
+    if (numPoints == 0):
+        return result
+    ends = np.arange(numPoints)
+    levels = np.floor(np.log2(ends - starts + 1)).astype(int)
+    table = np.asarray(values, dtype=float)
+    for level in range(levels.max() + 1):
+        span = 1 << level
+        if (level > 0): # combine two runs of the previous level
+            table = reduceFunc(table[:-(span // 2)], table[span // 2:])
+        query = np.nonzero(levels == level)[0]
+        if (len(query)):
+            result[query] = reduceFunc(table[starts[query]], table[ends[query] - span + 1])
+    return result
+
+def rollingWindow(times, values, window, operator, resetEdges=None):
+    # Rolling sum, mean, min, or max over the window (seconds) ending at each point of irregularly
+    # spaced data in time order.  Sums and means use prefix sums, NaN (NULL) values are skipped and
+    # windows without valid values are NaN.
+    if (operator not in rollingOperators):
+        raise ValueError("Unknown rolling operator: {}".format(operator))
+    values = np.asarray(values, dtype=float)
+    starts = getWindowStarts(times, window, resetEdges)
+    if (operator == 'min'):
+        return windowExtreme(values, starts, np.fmin)
+    if (operator == 'max'):
+        return windowExtreme(values, starts, np.fmax)
+
+    isValid = ~np.isnan(values)
+    ends = np.arange(1, len(values) + 1)
+    sumPrefix = np.concatenate(([0.0], np.cumsum(np.where(isValid, values, 0.0))))
+    countPrefix = np.concatenate(([0], np.cumsum(isValid)))
+    sums = sumPrefix[ends] - sumPrefix[starts]
+    counts = countPrefix[ends] - countPrefix[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts if operator == 'mean' else sums, np.nan)
+
+def degreeDays(dailyMeans, base, kind='heating'):
+    # Heating (base - mean) or cooling (mean - base) degree days of each day, days without a mean
+    # are NaN
+    dailyMeans = np.asarray(dailyMeans, dtype=float)
+    with np.errstate(invalid='ignore'):
+        difference = base - dailyMeans if kind == 'heating' else dailyMeans - base
+        return np.where(np.isnan(difference), np.nan, np.maximum(difference, 0.0))
@@ -0,0 +1,125 @@
+import sqlite3
+import numpy as np
+from threading import Lock
+
+
+class RollupStore():
+    # Min, max, sum, and count of archive observations for fixed size time steps (hourly and
+    # 15 minute by default) kept in a sidecar database next to the weewx database.  The weewx
+    # database is only read, the rollups are updated incrementally from the last archive record
+    # processed.  Steps are aligned to the epoch so they match local hours for whole hour time
+    # zone offsets.
+    def __init__(self, dbPool, rollupPath, observations=('outTemp', 'outHumidity', 'windSpeed', 'windGust', 'rain', 'rainRate'), stepSizes=(3600, 900), chunkSize=30*86400):
+        self.dbPool = dbPool # weewx database connections
+        self.rollupPath = rollupPath
+        self.observations = list(observations)
+        self.stepSizes = sorted(stepSizes, reverse=True) # coarsest first
+        self.chunkSize = chunkSize # seconds of archive data processed per transaction
+
+        self.conn = None
+        self.lock = Lock()
+        self.lastDateTime = dict() # last archive record processed for each step size
+
+    def tableName(self, stepSize, entry):
+        return "rollup_{}_{}".format(int(stepSize), entry)
+
+    def open(self):
+        # Create sidecar database and tables if needed
+        if (self.conn is not None):
+            return
+        conn = sqlite3.connect(self.rollupPath, check_same_thread=False)
+        conn.execute('CREATE TABLE IF NOT EXISTS rollup_status (stepSize INTEGER NOT NULL PRIMARY KEY, lastDateTime INTEGER)')
+        for stepSize in self.stepSizes:
+            for entry in self.observations:
+                conn.execute('CREATE TABLE IF NOT EXISTS {} (dateTime INTEGER NOT NULL PRIMARY KEY, min REAL, max REAL, sum REAL, count INTEGER)'.format(self.tableName(stepSize, entry)))
+        conn.commit()
+
+        for stepSize, lastDateTime in conn.execute('SELECT stepSize, lastDateTime FROM rollup_status'):
+            self.lastDateTime[stepSize] = lastDateTime
+        self.conn = conn
+
+    def update(self):
+        # Add archive records written since the last update
+        with self.lock:
+            self.open()
+            with self.dbPool.connection() as archiveConn:
+                # MIN and MAX are separate queries so each is a single index lookup
+                latestTime = archiveConn.execute('SELECT MAX(dateTime) FROM archive').fetchone()[0]
+                if (latestTime is None): # no data
+                    return
+                firstTime = None
+
+                for stepSize in self.stepSizes:
+                    lastDateTime = self.lastDateTime.get(stepSize)
+                    if (lastDateTime == latestTime): # up to date
+                        continue
+
+                    if (lastDateTime is None and firstTime is None):
+                        firstTime = archiveConn.execute('SELECT MIN(dateTime) FROM archive').fetchone()[0]
+
+                    # Recalculate the step containing the last record processed since it may have been partial
+                    chunkStart = (firstTime if lastDateTime is None else lastDateTime) // stepSize * stepSize
+                    while (chunkStart <= latestTime):
+                        chunkEnd = min(chunkStart + self.chunkSize, latestTime + 1)
+                        self.updateChunk(archiveConn, stepSize, chunkStart, chunkEnd)
+                        chunkStart = chunkEnd
+
+                    self.conn.execute('INSERT OR REPLACE INTO rollup_status (stepSize, lastDateTime) VALUES (?, ?)', (stepSize, latestTime))
+                    self.conn.commit()
+                    self.lastDateTime[stepSize] = latestTime
+
+    def updateChunk(self, archiveConn, stepSize, chunkStart, chunkEnd):
+        # Calculate steps of archive records in [chunkStart, chunkEnd)
+        dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime >= ? AND dateTime < ? ORDER BY dateTime'.format(', '.join(self.observations))
+        dataArray = np.array(archiveConn.execute(dbRequest, (chunkStart, chunkEnd)).fetchall(), dtype=float).reshape(-1, len(self.observations) + 1)
+        if (len(dataArray) == 0):
+            return
+
+        # Records are in time order so each step is a contiguous run
+        steps = (dataArray[:,0] // stepSize * stepSize).astype('int64')
+        runStarts = np.concatenate(([0], np.nonzero(np.diff(steps))[0] + 1))
+        stepTimes = steps[runStarts]
+        for i, entry in enumerate(self.observations):
+            values = dataArray[:,i+1]
+            isValid = ~np.isnan(values)
+            with np.errstate(invalid='ignore'):
+                mins = np.fmin.reduceat(values, runStarts)
+                maxs = np.fmax.reduceat(values, runStarts)
+            sums = np.add.reduceat(np.where(isValid, values, 0.0), runStarts)
+            counts = np.add.reduceat(isValid.astype('int64'), runStarts)
+
+            # Steps without valid values keep NULL summaries
+            rows = [(int(t), None if n == 0 else float(lo), None if n == 0 else float(hi), None if n == 0 else float(total), int(n)) for t, lo, hi, total, n in zip(stepTimes, mins, maxs, sums, counts)]
+            self.conn.executemany('INSERT OR REPLACE INTO {} (dateTime, min, max, sum, count) VALUES (?, ?, ?, ?, ?)'.format(self.tableName(stepSize, entry)), rows)
+
+    def getStepSize(self, entry, edges):
+        # Coarsest rollup whose steps line up with all step edges (other than the end time), None if
+        # no rollup can be used
+        if (entry not in self.observations or len(edges) < 2):
+            return None
+        for stepSize in self.stepSizes:
+            if (np.all(np.mod(edges[:-1], stepSize) == 0)):
+                return stepSize
+        return None
+
+    def getSummaries(self, entry, startTimeEpoch, endTimeEpoch, stepSize):
+        # Rollup rows (dateTime, min, max, sum, count) for complete rollup steps in the requested
+        # range.  Also returns the time the rollup data ends, archive records from then on need to be
+        # read from the archive.
+        self.update()
+        with self.lock:
+            lastDateTime = self.lastDateTime.get(stepSize)
+            if (lastDateTime is None):
+                return np.zeros((0, 5)), startTimeEpoch
+            rollupEnd = min(endTimeEpoch // stepSize * stepSize, lastDateTime // stepSize * stepSize)
+            rollupEnd = max(rollupEnd, startTimeEpoch)
+            dbRequest = 'SELECT dateTime, min, max, sum, count FROM {} WHERE dateTime >= ? AND dateTime < ? ORDER BY dateTime'.format(self.tableName(stepSize, entry))
+            dataTable = self.conn.execute(dbRequest, (startTimeEpoch, rollupEnd)).fetchall()
+
+        return np.array(dataTable, dtype=float).reshape(-1, 5), rollupEnd
+
+    def close(self):
+        with self.lock:
+            if (self.conn is not None):
+                self.conn.close()
+                self.conn = None
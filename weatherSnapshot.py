@@ -0,0 +1,163 @@
+import os, glob, time, logging
+import sqlite3
+from threading import Thread, Lock, Event
+from urllib.request import pathname2url
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseSnapshot(Thread):
+    # Local copy of the weewx database (e.g. on tmpfs) that the dashboard reads instead of the
+    # database weewx is writing, which may be on a network mount.  The copy is checked every
+    # interval seconds and synced when the database file has changed.  Rows added since the last
+    # sync are copied into the snapshot (weewx only appends archive records and updates the
+    # summary of the current day), the whole database is copied with the SQLite backup API on the
+    # first sync, when the schema or old records changed, and every fullInterval seconds.  Each
+    # full copy is a new file so connections reading the previous copy are not disturbed.
+    def __init__(self, sourcePath, snapshotDir, interval=30.0, fullInterval=86400.0, pagesPerStep=4096, onNewFile=None, metrics=None):
+        super().__init__(daemon=True)
+        self.sourcePath = sourcePath
+        self.snapshotDir = snapshotDir
+        self.interval = interval
+        self.fullInterval = fullInterval
+        self.pagesPerStep = pagesPerStep # pages copied per backup step, other connections can use the source between steps
+        self.onNewFile = onNewFile # called with the path of each new snapshot file
+        self.metrics = metrics
+
+        self.lock = Lock()
+        self.stopEvent = Event()
+        self.conn = None # writer connection of the current snapshot
+        self.snapshotPath = None
+        self.sourceStat = None # source file state at the last sync
+        self.status = {'path': None, 'lastSync': None, 'lastFullCopy': None, 'latestTime': None, 'copySeconds': None, 'mode': None, 'error': None}
+
+        if (metrics is not None):
+            metrics.setGauge('snapshot_age_seconds', "Seconds since the database snapshot was last synced", lambda: self.getStatus()['age'])
+            metrics.setGauge('snapshot_copy_seconds', "Duration of the last database snapshot sync", lambda: self.status['copySeconds'])
+
+    def openSource(self):
+        uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(self.sourcePath)))
+        return sqlite3.connect(uri, uri=True)
+
+    def getSourceStat(self):
+        # File state that changes when weewx writes (the journal is only present during writes)
+        sourceStat = os.stat(self.sourcePath)
+        return (sourceStat.st_mtime_ns, sourceStat.st_size, sourceStat.st_ino)
+
+    def sync(self, force=False):
+        # Bring the snapshot up to date if the database changed, returns True if it was synced
+        with self.lock:
+            try:
+                sourceStat = self.getSourceStat()
+                if (not force and self.conn is not None and sourceStat == self.sourceStat):
+                    return False
+
+                start = time.perf_counter()
+                mode = 'incremental'
+                fullDue = self.fullInterval is not None and (self.status['lastFullCopy'] is None or time.time() - self.status['lastFullCopy'] > self.fullInterval)
+                if (self.conn is None or fullDue or not self.copyNewRows()):
+                    mode = 'full'
+                    self.copyAll()
+                copySeconds = time.perf_counter() - start
+
+                self.sourceStat = sourceStat
+                latestTime = self.conn.execute('SELECT MAX(dateTime) FROM archive').fetchone()[0]
+                self.status.update({'path': self.snapshotPath, 'lastSync': time.time(), 'latestTime': latestTime, 'copySeconds': copySeconds, 'mode': mode, 'error': None})
+                if (mode == 'full'):
+                    self.status['lastFullCopy'] = self.status['lastSync']
+                if (self.metrics is not None):
+                    self.metrics.observe('snapshotSync', copySeconds, {}, mode=mode)
+                logger.debug("Snapshot %s sync of %s took %.3f s", mode, self.sourcePath, copySeconds)
+                return True
+
+            except (OSError, sqlite3.Error) as e: # keep serving the previous snapshot
+                self.status['error'] = str(e)
+                logger.warning("Snapshot of %s failed: %s", self.sourcePath, e)
+                return False
+
+    def copyAll(self):
+        # Copy the whole database into a new snapshot file with the online backup API
+        os.makedirs(self.snapshotDir, exist_ok=True)
+        snapshotPath = os.path.join(self.snapshotDir, "snapshot_{}_{}.sdb".format(os.getpid(), time.time_ns()))
+        source = self.openSource()
+        conn = sqlite3.connect('file:{}'.format(pathname2url(snapshotPath)), uri=True, check_same_thread=False, isolation_level=None)
+        try:
+            source.backup(conn, pages=self.pagesPerStep)
+            conn.execute('PRAGMA journal_mode = WAL') # readers are not blocked by incremental syncs
+        except sqlite3.Error:
+            conn.close()
+            self.removeFiles(snapshotPath)
+            raise
+        finally:
+            source.close()
+
+        oldPath = self.snapshotPath
+        if (self.conn is not None):
+            self.conn.close()
+        self.conn = conn
+        self.snapshotPath = snapshotPath
+        if (self.onNewFile is not None):
+            self.onNewFile(snapshotPath)
+        if (oldPath is not None): # open readers keep the deleted file until they are closed
+            self.removeFiles(oldPath)
+
+    def copyNewRows(self):
+        # Copy rows added since the last sync, returns False if a full copy is needed instead
+        conn = self.conn
+        conn.execute("ATTACH DATABASE ? AS source", ('file:{}?mode=ro'.format(pathname2url(os.path.abspath(self.sourcePath))),))
+        try:
+            schema = "SELECT type, name, sql FROM {}.sqlite_master ORDER BY type, name"
+            if (conn.execute(schema.format('main')).fetchall() != conn.execute(schema.format('source')).fetchall()):
+                return False
+
+            # Last record copied must be unchanged, otherwise older records may have been changed too
+            lastTime = conn.execute('SELECT MAX(dateTime) FROM main.archive').fetchone()[0]
+            lastRecord = 'SELECT * FROM {}.archive WHERE dateTime = ?'
+            if (lastTime is not None and conn.execute(lastRecord.format('main'), (lastTime,)).fetchall() != conn.execute(lastRecord.format('source'), (lastTime,)).fetchall()):
+                return False
+
+            conn.execute('BEGIN')
+            try:
+                for (tableName,) in conn.execute("SELECT name FROM source.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall():
+                    columns = [row[1] for row in conn.execute('PRAGMA source.table_info("{}")'.format(tableName.replace('"', '""')))]
+                    table = '"{}"'.format(tableName.replace('"', '""'))
+                    if ('dateTime' in columns): # rows keyed on time, copy from the latest row on
+                        latest = conn.execute('SELECT MAX(dateTime) FROM main.{}'.format(table)).fetchone()[0]
+                        conn.execute('INSERT OR REPLACE INTO main.{0} SELECT * FROM source.{0} WHERE dateTime >= ?'.format(table), (latest if latest is not None else 0,))
+                    else: # small tables (e.g. metadata) are copied whole
+                        conn.execute('DELETE FROM main.{}'.format(table))
+                        conn.execute('INSERT INTO main.{0} SELECT * FROM source.{0}'.format(table))
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+            return True
+        finally:
+            conn.execute('DETACH DATABASE source')
+
+    def removeFiles(self, path):
+        for filePath in glob.glob(glob.escape(path) + "*"): # database, WAL, and shared memory files
+            try:
+                os.remove(filePath)
+            except OSError:
+                pass
+
+    def getStatus(self):
+        # Snapshot state including its age (seconds since the last sync)
+        status = dict(self.status)
+        status['age'] = time.time() - status['lastSync'] if status['lastSync'] is not None else None
+        return status
+
+    def run(self):
+        while (not self.stopEvent.wait(self.interval)):
+            self.sync()
+
+    def stop(self):
+        self.stopEvent.set()
+        with self.lock:
+            if (self.conn is not None):
+                self.conn.close()
+                self.conn = None
+            if (self.snapshotPath is not None):
+                self.removeFiles(self.snapshotPath)
+                self.snapshotPath = None
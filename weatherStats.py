@@ -1,20 +1,39 @@
-import math, time, copy
+import re, os, json, uuid, logging
 import sqlite3
 import matplotlib.pyplot as plt
 import datetime
-from calendar import monthrange
 import numpy as np
 from enum import IntEnum
-from threading import Thread
-import pandas as pd
-import plotly.express as px
+from threading import Thread, Lock, RLock, Condition, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from collections import OrderedDict
+from urllib.request import pathname2url
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from weatherRollup import RollupStore
+from weatherColumns import ColumnStore, roundFloat32
+from weatherMetrics import Metrics
+from weatherSnapshot import DatabaseSnapshot
+from weatherCalendar import epochToLocal, localToEpoch, calendarEdges, getUniformStep, getStepAnchor
+from weatherRolling import cumulativeSum, rollingWindow, degreeDays
+from weatherClimatology import ClimatologyStore
+from weatherHistogram import getNumBins, getBinIndex, binCounts, circularMean, createWindRoseFigure, createHeatmapFigure
+
+logger = logging.getLogger(__name__)
+
+# Table named in a database request, used to label its timing
+tablePattern = re.compile(r'\bFROM\s+(\w+)', re.IGNORECASE)
 
 
 def capitalizeFirst(strIn):
     return strIn[0].upper() + strIn[1:]
 
+def checkIdentifier(name):
+    # Table and column names can not be bound as query parameters so only plain identifiers are allowed
+    if (not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name)):
+        raise ValueError("Invalid database identifier: {}".format(name))
+    return name
+
 class PlotStep(IntEnum):
     ALL = 1
     HOURLY = 2
@@ -22,6 +41,20 @@ class PlotStep(IntEnum):
     WEEKLY = 4
     MONTHLY = 5
     ANNUALLY = 6
+    FIVE_MINUTE = 7
+    FIFTEEN_MINUTE = 8
+    THREE_HOURLY = 9
+    QUARTERLY = 10
+    SEASONALLY = 11
+
+# Calendar unit and count of each plot step (see weatherCalendar.calendarEdges)
+stepUnits = {PlotStep.FIVE_MINUTE: ('minute', 5), PlotStep.FIFTEEN_MINUTE: ('minute', 15), PlotStep.HOURLY: ('hour', 1), PlotStep.THREE_HOURLY: ('hour', 3),
+    PlotStep.DAILY: ('day', 1), PlotStep.WEEKLY: ('week', 1), PlotStep.MONTHLY: ('month', 1), PlotStep.QUARTERLY: ('quarter', 1),
+    PlotStep.SEASONALLY: ('season', 1), PlotStep.ANNUALLY: ('year', 1)}
+
+def usesDaySummaries(step):
+    # Steps of a day or longer are calculated from the daily summary tables
+    return step in stepUnits and stepUnits[step][0] not in ('minute', 'hour')
 
 class CalcType(IntEnum):
     MIN = 1
@@ -29,6 +62,24 @@ class CalcType(IntEnum):
     AVG = 3
     SUM = 4
     STATS = 5
+    CUMSUM = 6
+    ROLLING_SUM = 7
+    ROLLING_MEAN = 8
+    ROLLING_MIN = 9
+    ROLLING_MAX = 10
+    HEATING_DEGREE_DAYS = 11
+    COOLING_DEGREE_DAYS = 12
+    WIND_ROSE = 13
+
+# Rolling operator of each rolling calculation type
+rollingCalcTypes = {CalcType.ROLLING_SUM: 'sum', CalcType.ROLLING_MEAN: 'mean', CalcType.ROLLING_MIN: 'min', CalcType.ROLLING_MAX: 'max'}
+
+def formatWindow(seconds):
+    # Rolling window length for titles
+    for unitSeconds, unit in ((86400, 'd'), (3600, 'h'), (60, 'min')):
+        if (seconds >= unitSeconds and seconds % unitSeconds == 0):
+            return "{:d} {}".format(int(seconds // unitSeconds), unit)
+    return "{:g} s".format(seconds)
 
 class DataCalculation():
     def __init__(self, calcType):
@@ -60,10 +111,616 @@ class DataCalculation():
         elif (self.calcType == CalcType.SUM):
             self.calc += value
 
+def getStepBounds(edges, times):
+    # Points of each step in time order.  Data before the first step is counted in the first step
+    # and data at or after the end time is dropped.  Returns the order of the points used (a slice
+    # when the data is already in time order, so selecting them makes no copies) and the start of
+    # each step in the ordered points, with the number of points used as the last bound.
+    times = np.asarray(times, dtype=float)
+    if (len(edges) == 0):
+        return slice(0, 0), np.zeros(1, dtype='int64')
+    if (np.any(times[1:] < times[:-1])): # data must be in time order for the segment reductions
+        order = np.argsort(times, kind='stable')
+        bounds = np.searchsorted(times[order], edges, side='left')
+    else:
+        order = None
+        bounds = np.searchsorted(times, edges, side='left')
+    bounds[0] = 0
+    order = slice(0, bounds[-1]) if order is None else order[:bounds[-1]]
+
+    return order, bounds
+
+def assignSteps(edges, times):
+    # Step of each point in time order (see getStepBounds).  Returns the order of the points used
+    # and the step of each of those points.
+    order, bounds = getStepBounds(edges, times)
+    stepIndex = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+
+    return order, stepIndex
+
+def aggregateSteps(edges, times, values, calcType):
+    # Vectorized DataCalculation over every step at once.  Returns the indices of the
+    # steps that contain data and the calculated value for each of those steps.
+    numSteps = len(edges) - 1
+    if (numSteps < 1):
+        return np.zeros(0, dtype=int), np.zeros(0)
+    order, bounds = getStepBounds(edges, times)
+    values = np.asarray(values, dtype=float)[order]
+
+    # Each step is a contiguous run of the ordered points, NaN (NULL) values are ignored, the same
+    # as the database aggregates
+    hasData = np.diff(bounds) > 0
+    segStarts = bounds[:-1][hasData]
+    if (len(values) == 0):
+        calc = np.zeros(0)
+    elif (calcType == CalcType.MIN or calcType == CalcType.MAX):
+        reduceFunc = np.fmin if calcType == CalcType.MIN else np.fmax
+        calc = reduceFunc.reduceat(values, segStarts)
+    elif (calcType == CalcType.SUM or calcType == CalcType.AVG):
+        # Steps without valid values are NaN, the same as SUM in the database
+        isValid = ~np.isnan(values)
+        calc = np.add.reduceat(np.where(isValid, values, 0.0), segStarts)
+        validPrefix = np.concatenate(([0], np.cumsum(isValid)))
+        validCounts = (validPrefix[bounds[1:]] - validPrefix[bounds[:-1]])[hasData]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            calc = np.where(validCounts > 0, calc / validCounts if calcType == CalcType.AVG else calc, np.nan)
+    else:
+        raise ValueError("Unsupported calculation type: {}".format(calcType.name))
+
+    return np.nonzero(hasData)[0], calc
+
+class StepAccumulator():
+    # Step results of data arriving in chunks (e.g. streamed from the database), so only the
+    # per-step min, max, sum, and counts are held instead of all of the data.  Gives the same
+    # results as aggregateSteps over all of the data.
+    def __init__(self, edges):
+        self.edges = edges
+        numSteps = max(len(edges) - 1, 0)
+        self.numRows = np.zeros(numSteps, dtype='int64') # including NULL values
+        self.counts = np.zeros(numSteps, dtype='int64')
+        self.sums = np.zeros(numSteps)
+        self.mins = np.full(numSteps, np.nan)
+        self.maxs = np.full(numSteps, np.nan)
+
+    def add(self, times, values):
+        numSteps = len(self.numRows)
+        if (numSteps < 1 or len(times) == 0):
+            return
+        order, stepIndex = assignSteps(self.edges, times)
+        if (len(stepIndex) == 0):
+            return
+        values = np.asarray(values, dtype=float)[order]
+        isValid = ~np.isnan(values)
+
+        self.numRows += np.bincount(stepIndex, minlength=numSteps)
+        self.counts += np.bincount(stepIndex, weights=isValid, minlength=numSteps).astype('int64')
+        self.sums += np.bincount(stepIndex, weights=np.where(isValid, values, 0.0), minlength=numSteps)
+
+        # Points are in time order so each step is a contiguous run
+        runStarts = np.concatenate(([0], np.nonzero(np.diff(stepIndex))[0] + 1))
+        runSteps = stepIndex[runStarts]
+        with np.errstate(invalid='ignore'):
+            self.mins[runSteps] = np.fmin(self.mins[runSteps], np.fmin.reduceat(values, runStarts))
+            self.maxs[runSteps] = np.fmax(self.maxs[runSteps], np.fmax.reduceat(values, runStarts))
+
+    def result(self, calcType):
+        # Indices of the steps that contain data and the calculated value for each of those steps
+        hasData = self.numRows > 0
+        if (calcType == CalcType.MIN):
+            calc = self.mins[hasData]
+        elif (calcType == CalcType.MAX):
+            calc = self.maxs[hasData]
+        elif (calcType == CalcType.SUM):
+            calc = np.where(self.counts[hasData] > 0, self.sums[hasData], np.nan)
+        elif (calcType == CalcType.AVG):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                calc = self.sums[hasData] / self.counts[hasData]
+        else:
+            raise ValueError("Unsupported calculation type: {}".format(calcType.name))
+
+        return np.nonzero(hasData)[0], calc
+
+def sumSteps(edges, times, columns):
+    # Sum of each column in each step, NaN (NULL) values are ignored.  Returns the indices of the
+    # steps that contain data and an array with a row of sums for each of those steps.
+    numSteps = len(edges) - 1
+    columns = np.asarray(columns, dtype=float).reshape(len(times), -1)
+    if (numSteps < 1):
+        return np.zeros(0, dtype=int), np.zeros((0, columns.shape[1]))
+    order, stepIndex = assignSteps(edges, times)
+    columns = np.nan_to_num(columns[order])
+
+    hasData = np.bincount(stepIndex, minlength=numSteps) > 0
+    stepSums = np.column_stack([np.bincount(stepIndex, weights=columns[:,i], minlength=numSteps)[hasData] for i in range(columns.shape[1])])
+
+    return np.nonzero(hasData)[0], stepSums.reshape(-1, columns.shape[1])
+
+def aggregateSummary(edges, times, mins, maxs, sums, counts, wsums=None, sumtimes=None):
+    # Combine min/max/sum/count summaries (daily rows or steps already calculated by the database)
+    # into each step.  Raw samples are their own summary with a count of one.  The average is time
+    # weighted when the weighted sums (wsum/sumtime) are given.  NaN (NULL) values are ignored.
+    # Returns the indices of the steps that contain data and the min, max, sum, count, and avg of
+    # each of those steps.
+    numSteps = len(edges) - 1
+    if (numSteps < 1):
+        return np.zeros(0, dtype=int), {stat: np.zeros(0) for stat in ('min', 'max', 'sum', 'count', 'avg')}
+    order, stepIndex = assignSteps(edges, times)
+    mins = np.asarray(mins, dtype=float)[order]
+    maxs = np.asarray(maxs, dtype=float)[order]
+    sums = np.asarray(sums, dtype=float)[order]
+    counts = np.asarray(counts, dtype=float)[order]
+
+    numRows = np.bincount(stepIndex, minlength=numSteps)
+    hasData = numRows > 0
+    segStarts = (np.cumsum(numRows) - numRows)[hasData]
+
+    stepStats = dict()
+    stepStats['min'] = np.fmin.reduceat(mins, segStarts) if len(mins) else np.zeros(0)
+    stepStats['max'] = np.fmax.reduceat(maxs, segStarts) if len(maxs) else np.zeros(0)
+    stepStats['sum'] = np.bincount(stepIndex, weights=np.nan_to_num(sums), minlength=numSteps)[hasData]
+    stepStats['count'] = np.bincount(stepIndex, weights=np.nan_to_num(counts), minlength=numSteps)[hasData]
+    stepStats['sum'] = np.where(stepStats['count'] > 0, stepStats['sum'], np.nan) # no valid values, the same as SUM in the database
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stepStats['avg'] = np.where(stepStats['count'] > 0, stepStats['sum'] / stepStats['count'], np.nan)
+        if (wsums is not None):
+            wsums = np.nan_to_num(np.asarray(wsums, dtype=float)[order])
+            sumtimes = np.nan_to_num(np.asarray(sumtimes, dtype=float)[order])
+            stepWsum = np.bincount(stepIndex, weights=wsums, minlength=numSteps)[hasData]
+            stepSumtime = np.bincount(stepIndex, weights=sumtimes, minlength=numSteps)[hasData]
+            stepStats['avg'] = np.where(stepSumtime > 0, stepWsum / stepSumtime, stepStats['avg'])
+
+    return np.nonzero(hasData)[0], stepStats
+
+def aggregateStats(edges, times, values, stats):
+    # Any set of statistics (min, max, sum, count, avg, std, and percentiles given as 'p<percent>',
+    # e.g. 'p90') of the raw samples in each step, calculated in one pass over the data.  NaN (NULL)
+    # values are ignored.  Returns the indices of the steps that contain data and a dictionary of
+    # the values of each requested statistic.
+    values = np.asarray(values, dtype=float)
+    isValid = ~np.isnan(values)
+    stepIndex, stepStats = aggregateSummary(edges, times, values, values, values, isValid)
+    numSteps = len(edges) - 1
+    if (len(stepIndex) == 0):
+        return stepIndex, {stat: np.zeros(0) for stat in stats}
+
+    needsDistribution = [stat for stat in stats if stat == 'std' or stat.startswith('p')]
+    if (needsDistribution):
+        order, pointStep = assignSteps(edges, times)
+        pointValues = values[order]
+        pointValid = isValid[order]
+        validCounts = np.bincount(pointStep[pointValid], minlength=numSteps)[stepIndex]
+
+        if ('std' in stats): # population standard deviation
+            stepPos = np.full(numSteps, -1)
+            stepPos[stepIndex] = np.arange(len(stepIndex))
+            deviation = pointValues[pointValid] - stepStats['avg'][stepPos[pointStep[pointValid]]]
+            sqSum = np.bincount(pointStep[pointValid], weights=deviation**2, minlength=numSteps)[stepIndex]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stepStats['std'] = np.where(validCounts > 0, np.sqrt(sqSum / validCounts), np.nan)
+
+        percentiles = [stat for stat in stats if stat.startswith('p')]
+        if (percentiles):
+            # Sort valid values by step and then value, each step is a contiguous run
+            validStep = pointStep[pointValid]
+            validValues = pointValues[pointValid]
+            sortOrder = np.lexsort((validValues, validStep))
+            sortedValues = validValues[sortOrder]
+            runStarts = (np.cumsum(validCounts) - validCounts).astype(float)
+            for stat in percentiles:
+                # Linear interpolation between closest ranks
+                position = runStarts + float(stat[1:]) / 100.0 * np.maximum(validCounts - 1, 0)
+                lower = np.floor(position).astype(int)
+                upper = np.minimum(lower + 1, np.maximum(runStarts + validCounts - 1, 0).astype(int))
+                fraction = position - lower
+                if (len(sortedValues)):
+                    lowerValues = sortedValues[np.minimum(lower, len(sortedValues) - 1)]
+                    upperValues = sortedValues[np.minimum(upper, len(sortedValues) - 1)]
+                    stepStats[stat] = np.where(validCounts > 0, lowerValues + fraction * (upperValues - lowerValues), np.nan)
+                else:
+                    stepStats[stat] = np.full(len(stepIndex), np.nan)
+
+    return stepIndex, {stat: stepStats[stat] for stat in stats}
+
+# Figures with more points than this use WebGL traces instead of SVG
+webglThreshold = 5000
+
+# Layout shared by all graphs.  The default plotly template is filled in when the figure is
+# serialized, assigning a template object to every figure costs more than building the traces.
+graphLayout = {'xaxis': {'title': {'text': 'Date'}, 'type': 'date'}, 'legend': {'title': {'text': ''}, 'tracegroupgap': 0}, 'margin': {'t': 60}}
+
+def getPlotPositions(times):
+    # Numeric x positions of plot times, times that are not numeric (e.g. date strings) use their index
+    times = np.asarray(times)
+    if (times.dtype.kind == 'M'):
+        return times.astype('int64').astype(float)
+    elif (times.dtype.kind in 'iuf'):
+        return times.astype(float)
+    else:
+        return np.arange(len(times), dtype=float)
+
+def getFigureTimes(times):
+    # Plot times as milliseconds since the epoch, which plotly date axes show as the same wall clock
+    # times and which serialize much faster than date strings
+    times = np.asarray(times)
+    if (times.dtype.kind == 'M'):
+        return times.astype('datetime64[ms]').astype('int64')
+    return times
+
+def createFigure(series, title, yaxis_title, showlegend=True):
+    # Figure of (name, times, values) series built directly from the arrays.  Large figures use WebGL
+    # traces, which the browser draws much faster than SVG.
+    numPoints = sum(len(values) for name, times, values in series)
+    scatter = go.Scattergl if numPoints > webglThreshold else go.Scatter
+    traces = [scatter(x=getFigureTimes(times), y=values, name=name, mode='markers') for name, times, values in series]
+    fig = go.Figure(data=traces, layout=graphLayout)
+    fig.update_layout(title=title, yaxis_title=yaxis_title, showlegend=showlegend)
+
+    return fig
+
+def downsampleMinMax(times, values, maxPoints):
+    # Indices of the points to keep so the min and max point of each of maxPoints/2 equal width
+    # time buckets (roughly one per pixel column) are kept.  Peaks are always preserved.
+    values = np.asarray(values, dtype=float)
+    numPoints = len(values)
+    if (numPoints <= maxPoints):
+        return np.arange(numPoints)
+
+    x = getPlotPositions(times)
+    numBuckets = max((maxPoints - 2) // 2, 1)
+    span = x[-1] - x[0]
+    if (span > 0):
+        bucket = np.minimum(((x - x[0]) / span * numBuckets).astype(int), numBuckets - 1)
+    else:
+        bucket = np.zeros(numPoints, dtype=int)
+
+    # Sort each bucket by value, NaN (NULL) values sort to the end of the bucket
+    order = np.lexsort((values, bucket))
+    counts = np.bincount(bucket, minlength=numBuckets)
+    validCounts = np.bincount(bucket[~np.isnan(values)], minlength=numBuckets)
+    bucketStarts = np.cumsum(counts) - counts
+    hasData = validCounts > 0
+    minIndex = order[bucketStarts[hasData]]
+    maxIndex = order[(bucketStarts + validCounts - 1)[hasData]]
+
+    return np.unique(np.concatenate(([0, numPoints - 1], minIndex, maxIndex)))
+
+def downsampleLTTB(times, values, maxPoints):
+    # Indices of the points to keep using Largest-Triangle-Three-Buckets.  The point of each
+    # bucket that forms the largest triangle with the previously kept point and the average of
+    # the next bucket is kept.  NaN (NULL) values are dropped.
+    values = np.asarray(values, dtype=float)
+    valid = np.nonzero(~np.isnan(values))[0]
+    numPoints = len(valid)
+    if (numPoints <= maxPoints or maxPoints < 3):
+        return valid
+
+    x = getPlotPositions(times)[valid]
+    y = values[valid]
+    numBuckets = maxPoints - 2
+    bucketEdges = np.linspace(1, numPoints - 1, numBuckets + 1).astype(int)
+
+    # Average point of each bucket from prefix sums
+    xSum = np.concatenate(([0.0], np.cumsum(x)))
+    ySum = np.concatenate(([0.0], np.cumsum(y)))
+    bucketSizes = bucketEdges[1:] - bucketEdges[:-1]
+    xAvg = np.append((xSum[bucketEdges[1:]] - xSum[bucketEdges[:-1]]) / bucketSizes, x[-1])
+    yAvg = np.append((ySum[bucketEdges[1:]] - ySum[bucketEdges[:-1]]) / bucketSizes, y[-1])
+
+    keep = np.zeros(maxPoints, dtype=int)
+    keep[-1] = numPoints - 1
+    a = 0
+    for i in range(numBuckets):
+        lo = bucketEdges[i]
+        hi = bucketEdges[i+1]
+        area = np.abs((x[a] - xAvg[i+1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (yAvg[i+1] - y[a]))
+        a = lo + np.argmax(area)
+        keep[i+1] = a
+
+    return valid[keep]
+
+def downsampleSeries(times, values, maxPoints, method='minmax'):
+    # Reduce a plot series to about maxPoints points
+    if (method == 'lttb'):
+        keep = downsampleLTTB(times, values, maxPoints)
+    elif (method == 'minmax'):
+        keep = downsampleMinMax(times, values, maxPoints)
+    else:
+        raise ValueError("Unsupported downsample method: {}".format(method))
+
+    if (isinstance(times, list)):
+        times = [times[i] for i in keep]
+    else:
+        times = np.asarray(times)[keep]
+
+    return times, np.asarray(values)[keep]
+
+class DatabasePool():
+    # Pool of read only database connections that are kept open and reused between queries.
+    # Connections are checked out by one thread at a time so the pool is safe to share
+    # between the request threads of the web server.  Checking out a connection waits at most
+    # checkoutTimeout seconds.  Long streams (e.g. downloads) use dedicated connections outside the
+    # pool instead, at most maxDedicated at once.
+    def __init__(self, dbPath, maxConnections=8, cacheSize=-16384, mmapSize=256*1024*1024, cachedStatements=128, checkoutTimeout=30.0, maxDedicated=2):
+        self.dbPath = dbPath
+        self.maxConnections = maxConnections
+        self.checkoutTimeout = checkoutTimeout
+        self.dedicatedSlots = BoundedSemaphore(maxDedicated)
+        self.cacheSize = cacheSize # negative values are in KiB
+        self.mmapSize = mmapSize
+        self.cachedStatements = cachedStatements
+
+        self.idleConnections = [] # (generation, connection), the most recently used connection (last) has the warmest cache
+        self.numConnections = 0
+        self.generation = 0 # incremented when the database path changes
+        self.lock = Condition(Lock()) # notified when a connection is returned or a slot is freed
+
+    def openConnection(self):
+        uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(self.dbPath)))
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.cachedStatements)
+        conn.execute('PRAGMA query_only = 1')
+        conn.execute('PRAGMA cache_size = {}'.format(int(self.cacheSize)))
+        conn.execute('PRAGMA mmap_size = {}'.format(int(self.mmapSize)))
+
+        return conn
+
+    def setPath(self, dbPath):
+        # Switch to another database file (e.g. a new snapshot).  Idle connections to the old file
+        # are closed now, connections in use are closed as they are returned.  Each closed
+        # connection frees a slot for a waiting thread to open a connection to the new file.
+        with self.lock:
+            self.dbPath = dbPath
+            self.generation += 1
+            stale = self.idleConnections
+            self.idleConnections = []
+            self.numConnections -= len(stale)
+            self.lock.notify_all()
+        for generation, conn in stale:
+            conn.close()
+
+    def discard(self, conn):
+        # Close a connection that won't be reused and free its slot for a waiting thread
+        if (conn is not None):
+            conn.close()
+        with self.lock:
+            self.numConnections -= 1
+            self.lock.notify()
+
+    @contextmanager
+    def connection(self):
+        # Check out a connection, opening a new one if none are idle and the pool is not full,
+        # otherwise waiting until a connection is returned or a slot is freed
+        conn = None
+        while (conn is None):
+            with self.lock:
+                if (not self.lock.wait_for(lambda: self.idleConnections or self.numConnections < self.maxConnections, self.checkoutTimeout)):
+                    raise sqlite3.OperationalError("No database connection available after {:g} s".format(self.checkoutTimeout))
+                if (self.idleConnections):
+                    generation, conn = self.idleConnections.pop()
+                else:
+                    self.numConnections += 1
+                    generation = self.generation
+            if (conn is None):
+                try:
+                    conn = self.openConnection()
+                except Exception:
+                    self.discard(None)
+                    raise
+            elif (generation != self.generation): # connection to an old database file
+                self.discard(conn)
+                conn = None
+
+        reuse = True
+        try:
+            yield conn
+        except sqlite3.DatabaseError: # connection may no longer be usable
+            reuse = False
+            raise
+        finally:
+            if (not reuse):
+                self.discard(conn)
+            elif (generation == self.generation):
+                with self.lock:
+                    self.idleConnections.append((generation, conn))
+                    self.lock.notify()
+            else: # connection to an old database file
+                self.discard(conn)
+
+    @contextmanager
+    def dedicatedConnection(self):
+        # A new connection of its own that is closed when done, for reads that are paced by a
+        # client and would otherwise keep a pooled connection from other requests
+        if (not self.dedicatedSlots.acquire(timeout=self.checkoutTimeout)):
+            raise sqlite3.OperationalError("No dedicated database connection available after {:g} s".format(self.checkoutTimeout))
+        try:
+            conn = self.openConnection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+        finally:
+            self.dedicatedSlots.release()
+
+    def close(self):
+        # Close all idle connections
+        with self.lock:
+            idle = self.idleConnections
+            self.idleConnections = []
+            self.numConnections -= len(idle)
+            self.lock.notify_all()
+        for generation, conn in idle:
+            conn.close()
+
+class FigureCache():
+    # Serialized figures keyed on (name, day).  Each figure is stored with the time of the latest
+    # archive record it was built from and is only rebuilt once a newer record has been written.
+    # Figures are built outside the lock, only one build runs per key and callers asking for a key
+    # that is being built wait for its result.
+    def __init__(self):
+        self.figures = dict()
+        self.inFlight = dict() # key -> (version, future)
+        self.lock = Lock()
+
+    def get(self, key, version, createFigure):
+        with self.lock:
+            cached = self.figures.get(key)
+            if (cached is not None and cached[0] == version):
+                return cached[1]
+
+            flight = self.inFlight.get(key)
+            if (flight is not None and flight[0] == version):
+                future = flight[1]
+                owner = False
+            else:
+                future = Future()
+                self.inFlight[key] = (version, future)
+                owner = True
+
+        if (not owner): # wait for the build already running
+            return future.result()
+
+        try:
+            figure = json.loads(createFigure().to_json())
+        except Exception as error:
+            with self.lock:
+                if (self.inFlight.get(key, (None, None))[1] is future):
+                    del self.inFlight[key]
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            if (self.inFlight.get(key, (None, None))[1] is future): # not superseded by a newer version
+                del self.inFlight[key]
+
+                # Only the latest day is kept for each figure
+                for oldKey in [k for k in self.figures if k[0] == key[0]]:
+                    del self.figures[oldKey]
+                self.figures[key] = (version, figure)
+        future.set_result(figure)
+
+        return figure
+
+class PlotDataCache():
+    # Plot data keyed on the normalized plot request, evicted least recently used once the arrays
+    # held pass maxBytes.  Only one computation runs per key, callers asking for a key that is
+    # being computed wait for its result.  Immutable entries (ranges ending before the latest
+    # archive record) are kept until evicted, others are recomputed once the version (time of the
+    # latest archive record) changes.
+    def __init__(self, maxBytes=256*1024*1024):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict() # key -> (version, immutable, data, size)
+        self.numBytes = 0
+        self.inFlight = dict() # key -> (version, future)
+        self.lock = Lock()
+
+    def dataSize(self, data):
+        # Approximate size of the arrays in plot data
+        if (isinstance(data, np.ndarray)):
+            return data.nbytes
+        if (isinstance(data, dict)):
+            return sum(self.dataSize(value) for value in data.values())
+        if (isinstance(data, (list, tuple))):
+            return sum(self.dataSize(value) for value in data)
+        return 64
+
+    def freeze(self, data):
+        # Cached arrays are shared by every caller so they are made read only
+        if (isinstance(data, np.ndarray)):
+            data.flags.writeable = False
+        elif (isinstance(data, dict)):
+            for value in data.values():
+                self.freeze(value)
+        elif (isinstance(data, (list, tuple))):
+            for value in data:
+                self.freeze(value)
+
+    def peek(self, key):
+        # Cached immutable data for key without calculating it, None if it isn't cached
+        with self.lock:
+            cached = self.entries.get(key)
+            if (cached is None or not cached[1]):
+                return None
+            self.entries.move_to_end(key)
+            return cached[2]
+
+    def get(self, key, version, immutable, calcData):
+        with self.lock:
+            cached = self.entries.get(key)
+            if (cached is not None and (cached[1] or cached[0] == version)):
+                self.entries.move_to_end(key)
+                return cached[2]
+
+            flight = self.inFlight.get(key)
+            if (flight is not None and flight[0] == version):
+                future = flight[1]
+                owner = False
+            else:
+                future = Future()
+                self.inFlight[key] = (version, future)
+                owner = True
+
+        if (not owner): # wait for the computation already running
+            return future.result()
+
+        try:
+            data = calcData()
+        except Exception as error:
+            with self.lock:
+                if (self.inFlight.get(key, (None, None))[1] is future):
+                    del self.inFlight[key]
+            future.set_exception(error)
+            raise
+
+        self.freeze(data)
+        size = self.dataSize(data)
+        with self.lock:
+            if (self.inFlight.get(key, (None, None))[1] is future):
+                del self.inFlight[key]
+            if (size <= self.maxBytes):
+                if (key in self.entries):
+                    self.numBytes -= self.entries.pop(key)[3]
+                self.entries[key] = (version, immutable, data, size)
+                self.numBytes += size
+                while (self.numBytes > self.maxBytes):
+                    self.numBytes -= self.entries.popitem(last=False)[1][3]
+        future.set_result(data)
+
+        return data
+
 class WeatherPlotter:
-    def __init__(self, dbPath, units, plotStyle=None):
+    def __init__(self, dbPath, units, plotStyle=None, sqlAggregate=True, rollupPath=None, columnDir=None, cacheBytes=256*1024*1024, slowTime=None, snapshotDir=None, climatePath=None):
         self.dbPath = dbPath
         self.units = units
+
+        # Calculate fixed size steps in the database instead of fetching every row
+        self.sqlAggregate = sqlAggregate
+
+        # Timing of requests, spans slower than slowTime (seconds) are logged
+        self.metrics = Metrics(slowTime)
+
+        # Database connections, reading a local snapshot of the database if snapshotDir is given
+        self.snapshot = None
+        if (snapshotDir):
+            self.snapshot = DatabaseSnapshot(dbPath, snapshotDir, metrics=self.metrics)
+            self.snapshot.sync()
+        self.dbPool = DatabasePool(self.snapshot.snapshotPath if self.snapshot and self.snapshot.snapshotPath else dbPath)
+        if (self.snapshot is not None):
+            self.snapshot.onNewFile = self.dbPool.setPath
+            self.snapshot.start()
+
+        # Hourly and 15 minute summaries kept in a separate database
+        self.rollups = RollupStore(self.dbPool, rollupPath) if rollupPath else None
+
+        # Memory mapped copy of the archive columns
+        self.columns = ColumnStore(self.dbPool, columnDir) if columnDir else None
+
+        # Day of year normals and records
+        self.climatology = ClimatologyStore(self.dbPool, climatePath) if climatePath else None
+
+        # Results of plot requests
+        self.plotDataCache = PlotDataCache(cacheBytes)
+
+        # Observation columns of the archive table, read when first needed
+        self.observations = None
         
         # Plot style
         if (plotStyle):
@@ -75,126 +732,264 @@ class WeatherPlotter:
 
         # Current weather
         self.currentConditions = dict()
+        self.currentConditionsTime = None # archive time of current conditions
+        self.currentConditionsLock = Lock()
 
-    def getFromDatabase(self, dbRequest):
-        conn = sqlite3.connect(self.dbPath)
-        dbCursor = conn.cursor()
-        dbCursor.execute(dbRequest)
-        dataTable = dbCursor.fetchall()
-
-        conn.close()
+    def getFromDatabase(self, dbRequest, params=()):
+        table = tablePattern.search(dbRequest)
+        with self.metrics.span('sql', table=table.group(1) if table else '') as span:
+            with self.dbPool.connection() as conn:
+                dataTable = conn.execute(dbRequest, params).fetchall()
+            span['rows'] = len(dataTable)
+            span['detail'] = lambda: self.explainQuery(dbRequest, params)
 
         return dataTable
+
+    def iterArrayFromDatabase(self, dbRequest, params=(), numColumns=2, chunkSize=8192, dedicated=False):
+        # Rows of a database request as float arrays (NaN for NULL) of up to chunkSize rows, so large
+        # results never exist as Python tuples all at once.  The connection is held until the
+        # iteration finishes, a dedicated connection is used instead of a pooled one if the
+        # iteration is paced by a client.
+        table = tablePattern.search(dbRequest)
+        with self.metrics.span('sqlStream', table=table.group(1) if table else '') as span:
+            span['rows'] = 0
+            span['detail'] = lambda: self.explainQuery(dbRequest, params)
+            with (self.dbPool.dedicatedConnection() if dedicated else self.dbPool.connection()) as conn:
+                cursor = conn.execute(dbRequest, params)
+                while (True):
+                    rows = cursor.fetchmany(chunkSize)
+                    if (not rows):
+                        break
+                    span['rows'] += len(rows)
+                    yield np.array(rows, dtype=float).reshape(-1, numColumns)
+
+    def getArrayFromDatabase(self, dbRequest, params=(), numColumns=2, chunkSize=8192):
+        # Result of a database request as a float array (NaN for NULL), read in chunks into a buffer
+        # that grows as needed
+        dataArray = np.empty((0, numColumns))
+        length = 0
+        for chunk in self.iterArrayFromDatabase(dbRequest, params, numColumns, chunkSize):
+            if (length + len(chunk) > len(dataArray)): # grow in place when possible
+                dataArray.resize((max(2 * len(dataArray), length + len(chunk)), numColumns), refcheck=False)
+            dataArray[length:length + len(chunk)] = chunk
+            length += len(chunk)
+        dataArray.resize((length, numColumns), refcheck=False)
+
+        return dataArray
+
+    def explainQuery(self, dbRequest, params=()):
+        # Request and its query plan for the slow span log
+        with self.dbPool.connection() as conn:
+            plan = conn.execute('EXPLAIN QUERY PLAN ' + dbRequest, params).fetchall()
+
+        return "{} {}\n".format(' '.join(dbRequest.split()), params) + "\n".join("  " + str(row[-1]) for row in plan)
         
 
+    def getLatestTime(self):
+        # Time of the most recent archive record
+        return self.getFromDatabase('SELECT MAX(dateTime) FROM archive')[0][0]
+
+    def getNewRecords(self, entries, afterTimeEpoch):
+        # Archive records written after afterTimeEpoch as times and values of each entry, used to
+        # extend live graphs with only the new rows
+        dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime > ? ORDER BY dateTime'.format(', '.join(checkIdentifier(entry) for entry in entries))
+        dataArray = self.getArrayFromDatabase(dbRequest, (afterTimeEpoch,), len(entries) + 1)
+
+        return dataArray[:,0], {entry: dataArray[:,i+1] for i, entry in enumerate(entries)}
+
+    def getArchiveSum(self, entry, startTimeEpoch, endTimeEpoch):
+        # Sum of archive values between the start and end times (inclusive)
+        dbRequest = 'SELECT TOTAL({}) FROM archive WHERE dateTime between ? AND ?'.format(checkIdentifier(entry))
+        return self.getFromDatabase(dbRequest, (startTimeEpoch, endTimeEpoch))[0][0]
+
     def getCurrentWeather(self):
+        # Current conditions only change when weewx writes a new archive record so one snapshot is
+        # shared by all callers and only refreshed when the latest record time changes.  MAX(dateTime)
+        # is used as the check since PRAGMA data_version is only comparable within one connection.
+        latestTime = self.getLatestTime()
+        with self.currentConditionsLock:
+            if (latestTime is None or latestTime == self.currentConditionsTime):
+                return self.currentConditions
 
-        # Get current weather
-        dataTable = self.getFromDatabase('SELECT dateTime, outTemp, outHumidity, windSpeed, windDir, windGust, rain, rainRate FROM archive ORDER BY dateTime DESC LIMIT 1')
-        dataEntry = dataTable[0]
-        self.currentConditions['time'] = datetime.datetime.fromtimestamp(dataEntry[0])    
-    
-        # Temperature (max, min, current)
-        tempTable = self.getFromDatabase('SELECT dateTime, min, max FROM archive_day_outTemp ORDER BY dateTime DESC LIMIT 1')
-        self.currentConditions['outTemp'] = {'current': dataEntry[1], 'min': tempTable[0][1], 'max': tempTable[0][2]}
+            # Get current weather along with today's temperature range and rain total
+            dataTable = self.getFromDatabase('''SELECT a.dateTime, a.outTemp, a.outHumidity, a.windSpeed, a.windDir, a.windGust, a.rain, a.rainRate, t.min, t.max, r.sum
+                FROM archive AS a
+                LEFT JOIN archive_day_outTemp AS t ON t.dateTime = (SELECT MAX(dateTime) FROM archive_day_outTemp)
+                LEFT JOIN archive_day_rain AS r ON r.dateTime = (SELECT MAX(dateTime) FROM archive_day_rain)
+                WHERE a.dateTime = ?''', (latestTime,))
+            dataEntry = dataTable[0]
+
+            currentConditions = dict()
+            currentConditions['time'] = datetime.datetime.fromtimestamp(dataEntry[0])
 
-        # Humidity
-        self.currentConditions['humidity'] = dataEntry[2]    
+            # Temperature (max, min, current)
+            currentConditions['outTemp'] = {'current': dataEntry[1], 'min': dataEntry[8], 'max': dataEntry[9]}
 
-        # Precipitation Total and Rate
-        rainTable = self.getFromDatabase('SELECT dateTime, sum FROM archive_day_rain ORDER BY dateTime DESC LIMIT 1')
-        self.currentConditions['rain'] = {'sum': rainTable[0][1], 'rainRate': dataEntry[7]}
+            # Humidity
+            currentConditions['humidity'] = dataEntry[2]
 
-        # Wind Speed, Direction, and Gust
-        self.getFromDatabase('SELECT dateTime, outTemp, outHumidity, windSpeed, windDir, windGust, rain, rainRate FROM archive ORDER BY dateTime DESC LIMIT 1')
-        self.currentConditions['wind'] = {'speed': dataEntry[3], 'dir': dataEntry[4], 'gust': dataEntry[5]}
+            # Precipitation Total and Rate
+            currentConditions['rain'] = {'sum': dataEntry[10], 'rainRate': dataEntry[7]}
 
-        return self.currentConditions
+            # Wind Speed, Direction, and Gust
+            currentConditions['wind'] = {'speed': dataEntry[3], 'dir': dataEntry[4], 'gust': dataEntry[5]}
 
-    def calcPlotData(self, startTime, endTime, timeStep, dataArray, calcType, steps=[]):
+            # Replace snapshot instead of updating it so callers holding the previous one are unaffected
+            self.currentConditions = currentConditions
+            self.currentConditionsTime = latestTime
+
+            return self.currentConditions
+
+    def calcPlotData(self, edges, dataTimes, dataValues, calcType):
         # Calculate data at each step
-        if (steps):
-            numSteps = len(steps) # last step is end time
-        else: # calculate steps
-            currentTime = startTime
-            numSteps = math.ceil((endTime - startTime) / timeStep)
-            stepEnd = currentTime
-    
-        times = [0]*numSteps
-        valuePerStep = np.zeros(numSteps)
-        tablePos = 0
-        noDataSteps = []
-        for i in range(numSteps):
-            # Calculate value for this step
-            if (steps): # steps provided
-                stepStart = steps[i]
-                try:
-                    stepEnd = steps[i+1]
-                except IndexError: # last sep
-                    stepEnd = endTime
-            else: # calculate step end
-                stepStart = stepEnd # start is previous end time
-                stepEnd = currentTime + timeStep
-            if (stepEnd > endTime):
-                stepEnd = endTime
-                
-            stepCalc = None
-            try:
-                while (dataArray[tablePos,0] < stepEnd):
-                    if (stepCalc == None):
-                        stepCalc = DataCalculation(calcType) # calculation at this step
-                    stepCalc.update(dataArray[tablePos, 1])
-                    tablePos += 1
-            except IndexError: # end of data
-                pass
-                    
-            currentTime = stepEnd 
-            if (stepCalc): # add data point
-                times[i] = datetime.datetime.fromtimestamp(stepStart).strftime("%Y-%m-%d %H:%M")
-                valuePerStep[i] = stepCalc.calc
-            else: # no data available
-                noDataSteps.append(i)
-        
-        # Remove any empty data steps
-        noDataSteps.sort(reverse=True)
-        for step in noDataSteps:
-            del times[step]
-            valuePerStep = np.delete(valuePerStep, step)
+        if (len(dataTimes) == 0): # no data available
+            return [], np.zeros(0)
+        with self.metrics.span('calcPlotData', calcType=calcType.name) as span:
+            stepIndex, valuePerStep = aggregateSteps(edges, dataTimes, dataValues, calcType)
+
+            # Steps without data are not returned
+            times = epochToLocal(edges[stepIndex])
+            span['rows'] = len(dataTimes)
+            span['bytes'] = times.nbytes + valuePerStep.nbytes
 
         return times, valuePerStep
 
     def getTempPlotData(self, startTime, endTime, step):
         # Create a plot with min, max, and average temps for desired time span and step
-        minTime, minData = self.getData('outTemp', startTime, endTime, step, CalcType.MIN) # max
-        minType = ['min'] * len(minTime)
-        maxTime, maxData = self.getData('outTemp', startTime, endTime, step, CalcType.MAX) # min
-        maxType = ['max'] * len(maxTime)
-        avgTime, avgData = self.getData('outTemp', startTime, endTime, step, CalcType.AVG) # avg
-        avgType = ['avg'] * len(avgTime)
-            
+        times, tempStats = self.getDataStats('outTemp', startTime, endTime, step, ('min', 'max', 'avg'))
+
         # Combine data
-        allTime = np.concatenate((minTime, maxTime, avgTime), axis=0)
-        allData = np.concatenate((minData, maxData, avgData), axis=0)
-        allType = np.concatenate((minType, maxType, avgType), axis=0)
+        allTime = np.concatenate([times] * len(tempStats), axis=0)
+        allData = np.concatenate(list(tempStats.values()), axis=0)
+        allType = np.repeat(list(tempStats.keys()), len(times))
 
         return allTime, allData, allType
 
 
-    def getRainPlotData(self, startTime, endTime):
+    def getRainPlotData(self, startTime, endTime, archiveData=None):
         # Get data of running sum of rain over requested time span
-        times, rainValues = self.getData('rain', startTime, endTime, PlotStep.ALL)
-        
-        rainSumValues = np.zeros(rainValues.shape)
-        rainSum = 0.0
-        for i in range(len(rainValues)):
-            rainSum += rainValues[i]
-            rainSumValues[i] = rainSum
+        times, rainValues = self.getData('rain', startTime, endTime, PlotStep.ALL, archiveData=archiveData)
+        rainSumValues = cumulativeSum(times, rainValues)
 
         # Get rain rate data
-        timesRate, rainRateValues = self.getData('rainRate', startTime, endTime, PlotStep.ALL)
+        timesRate, rainRateValues = self.getData('rainRate', startTime, endTime, PlotStep.ALL, archiveData=archiveData)
 
         return {'rainSum': [times, rainSumValues], 'rainRate': [timesRate, rainRateValues]}
 
+    def getResetEdges(self, startTimeEpoch, endTimeEpoch, resetStep):
+        # Boundaries of resetStep steps between the start and end times where running totals and
+        # rolling windows restart, None for PlotStep.ALL
+        if (resetStep == PlotStep.ALL):
+            return None
+        unit, count = stepUnits[resetStep]
+        return calendarEdges(startTimeEpoch, endTimeEpoch, unit, count)[1:-1]
+
+    def getRollingData(self, entry, startTime, endTime, operator, window=None, resetStep=PlotStep.ALL):
+        # Running total (operator 'cumsum') or rolling sum, mean, min, or max over the last window
+        # seconds at each archive record, restarting at each resetStep boundary.  Rolling windows
+        # read records from before the start time so the first points cover a whole window.
+        startTimeEpoch = datetime.datetime.timestamp(startTime)
+        endTimeEpoch = datetime.datetime.timestamp(endTime)
+        readStart = startTimeEpoch if operator == 'cumsum' else startTimeEpoch - window
+        dataTimes, dataValues = self.getArchiveData(entry, readStart, endTimeEpoch)
+
+        with self.metrics.span('rolling', operator=operator) as span:
+            resetEdges = self.getResetEdges(readStart, endTimeEpoch, resetStep)
+            if (operator == 'cumsum'):
+                values = cumulativeSum(dataTimes, dataValues, resetEdges)
+            else:
+                values = rollingWindow(dataTimes, dataValues, window, operator, resetEdges)
+            inRange = dataTimes >= startTimeEpoch
+            span['rows'] = len(dataTimes)
+
+        return epochToLocal(dataTimes[inRange]), values[inRange]
+
+    def getDegreeDays(self, startTime, endTime, kind='heating', base=65.0, resetStep=PlotStep.ALL):
+        # Heating or cooling degree days of each day from the daily mean temperatures, and their
+        # running total restarting at each resetStep boundary
+        times, stats = self.getDataStats('outTemp', startTime, endTime, PlotStep.DAILY, ('avg',))
+        daily = degreeDays(stats['avg'], base, kind)
+        resetEdges = self.getResetEdges(datetime.datetime.timestamp(startTime), datetime.datetime.timestamp(endTime), resetStep)
+        total = cumulativeSum(times, daily, None if resetEdges is None else epochToLocal(resetEdges))
+
+        return times, daily, total
+
+    def iterArchivePairs(self, xEntry, yEntry, startTimeEpoch, endTimeEpoch, chunkSize=65536):
+        # Chunks of (times, x values, y values) of the archive records in [start, end), read from the
+        # column store when it has both entries
+        if (self.useColumnStore(xEntry) and self.useColumnStore(yEntry)):
+            times, xValues = self.getArchiveData(xEntry, startTimeEpoch, endTimeEpoch)
+            yTimes, yValues = self.getArchiveData(yEntry, startTimeEpoch, endTimeEpoch)
+            if (len(yTimes) == len(times)):
+                end = np.searchsorted(times, endTimeEpoch, side='left')
+                for start in range(0, end, chunkSize):
+                    stop = min(start + chunkSize, end)
+                    yield times[start:stop], np.asarray(xValues[start:stop], dtype=float), np.asarray(yValues[start:stop], dtype=float)
+                return
+
+        dbRequest = 'SELECT dateTime, {}, {} FROM archive WHERE dateTime >= ? AND dateTime < ? ORDER BY dateTime'.format(checkIdentifier(xEntry), checkIdentifier(yEntry))
+        for chunk in self.iterArrayFromDatabase(dbRequest, (startTimeEpoch, endTimeEpoch), 3, chunkSize):
+            yield chunk[:,0], chunk[:,1], chunk[:,2]
+
+    def getHistogram(self, xEntry, yEntry, startTimeEpoch, endTimeEpoch, xBins, yBins):
+        # Counts of the archive records in [start, end) in each (x bin, y bin) of two observations
+        # (e.g. windDir and windSpeed), with the sums of the sines and cosines of x in each bin when x
+        # is binned by direction sectors.  Counts of each complete month before the latest archive
+        # record are kept in the plot data cache, so only the months that aren't cached (and the
+        # partial months at the ends) are read from the archive.  A range with nothing cached is
+        # counted in one pass over the archive, from one bincount per chunk over (month, x, y).
+        numX, numY = getNumBins(xBins), getNumBins(yBins)
+        isDirection = xBins[0] == 'sectors'
+        latestTime = self.getLatestTime()
+
+        # Months of the range, a month is closed if it is complete and a record after it was written
+        edges = calendarEdges(startTimeEpoch, endTimeEpoch, 'month')
+        numMonths = len(edges) - 1
+        monthStarts = localToEpoch(epochToLocal(edges[[0, -1]]).astype('datetime64[M]'))
+        closed = np.full(numMonths, latestTime is not None)
+        closed[0] &= monthStarts[0] == edges[0]
+        closed[-1] &= monthStarts[1] == edges[-1]
+        if (latestTime is not None):
+            closed &= edges[1:] <= latestTime
+
+        monthKeys = [('histogramMonth', xEntry, yEntry, xBins, yBins, float(edges[i])) for i in range(numMonths)]
+        months = [self.plotDataCache.peek(monthKeys[i]) if closed[i] else None for i in range(numMonths)]
+        missing = np.array([month is None for month in months])
+
+        counts = np.zeros((numMonths, numX, numY), dtype='int64')
+        sinSums = np.zeros((numMonths, numX, numY)) if isDirection else None
+        cosSums = np.zeros((numMonths, numX, numY)) if isDirection else None
+        with self.metrics.span('histogram') as span:
+            span['rows'] = 0
+            # Each run of months that aren't cached is read in one pass
+            runStarts = np.nonzero(missing & ~np.concatenate(([False], missing[:-1])))[0]
+            runEnds = np.nonzero(missing & ~np.concatenate((missing[1:], [False])))[0] + 1
+            for first, last in zip(runStarts, runEnds):
+                for times, xValues, yValues in self.iterArchivePairs(xEntry, yEntry, edges[first], edges[last]):
+                    month = np.searchsorted(edges, times, side='right') - 1
+                    chunkCounts, chunkSins, chunkCoss = binCounts(month, numMonths, getBinIndex(xValues, xBins), getBinIndex(yValues, yBins), numX, numY, xValues if isDirection else None)
+                    counts += chunkCounts
+                    if (isDirection):
+                        sinSums += chunkSins
+                        cosSums += chunkCoss
+                    span['rows'] += len(times)
+
+            for i, month in enumerate(months):
+                if (month is not None):
+                    counts[i] = month['counts']
+                    if (isDirection):
+                        sinSums[i], cosSums[i] = month['sinSums'], month['cosSums']
+                elif (closed[i]):
+                    monthData = {'counts': counts[i].copy(), 'sinSums': sinSums[i].copy() if isDirection else None, 'cosSums': cosSums[i].copy() if isDirection else None}
+                    self.plotDataCache.get(monthKeys[i], latestTime, True, lambda monthData=monthData: monthData)
+
+        histogram = {'counts': counts.sum(axis=0), 'sinSums': None, 'cosSums': None, 'meanDirections': None}
+        if (isDirection):
+            histogram['sinSums'], histogram['cosSums'] = sinSums.sum(axis=0), cosSums.sum(axis=0)
+            histogram['meanDirections'] = circularMean(histogram['sinSums'], histogram['cosSums'])
+
+        return histogram
+
     def createTempPlot(self, startTime, endTime, step):
         # Create a plot with min, max, and average temps for desired time span and step
         fig, ax = plt.subplots()
@@ -204,106 +999,241 @@ class WeatherPlotter:
         ax = self.createDataPlot('outTemp', startTime, endTime, PlotStep.MONTHLY, CalcType.MAX, ax=ax) # min
         ax = self.createDataPlot('outTemp', startTime, endTime, PlotStep.MONTHLY, CalcType.AVG, ax=ax) # avg
     
-        ax.set_title("Temperature Summary Plot - {} - {} to {}".format(step.name.capitalize(), startTime.strftime("%Y-%m-%d %H:%M"), endTime.strftime("%Y-%m-%d %H:%M")))
+        ax.set_title("Temperature Summary Plot - {} - {} to {}".format(step.name.replace('_', ' ').capitalize(), startTime.strftime("%Y-%m-%d %H:%M"), endTime.strftime("%Y-%m-%d %H:%M")))
 
         return fig
 
-    def getAvg(self, entry, tableName, startTimeEpoch, endTimeEpoch):
-        # Get min and max and average
-        if ("day" in tableName):
-            minTable = self.getFromDatabase('SELECT dateTime, {} FROM {} WHERE dateTime between {} AND {}'.format(CalcType.MIN.name, tableName, startTimeEpoch, endTimeEpoch))
-            maxTable = self.getFromDatabase('SELECT dateTime, {} FROM {} WHERE dateTime between {} AND {}'.format(CalcType.MAX.name, tableName, startTimeEpoch, endTimeEpoch))
-                
-            dataArray = np.array(minTable)
-            for i in range(len(maxTable)):
-                dataArray[i,1] = (minTable[i][1] + maxTable[i][1]) / 2.0
+    def getAvg(self, tableName, startTimeEpoch, endTimeEpoch, edges):
+        # Average of each step from the daily sums.  Uses the time weighted sums (wsum/sumtime) when
+        # available, otherwise sum/count.  Longer steps combine the daily sums instead of averaging
+        # the daily averages.  Returns the indices of the steps that contain data and their averages.
+        stepSize = getUniformStep(edges)
+        if (self.sqlAggregate and stepSize is not None): # sum evenly spaced steps in the database
+            anchor = getStepAnchor(edges, stepSize)
+            dbRequest = ('SELECT ? + ? * CAST((dateTime - ?) / ? AS INTEGER) AS step, SUM(wsum), SUM(sumtime), SUM(sum), SUM(count) FROM {} '
+                'WHERE dateTime >= ? AND dateTime < ? GROUP BY step ORDER BY step').format(checkIdentifier(tableName))
+            params = (anchor, stepSize, anchor, stepSize, startTimeEpoch, endTimeEpoch)
+        else:
+            dbRequest = 'SELECT dateTime, wsum, sumtime, sum, count FROM {} WHERE dateTime >= ? AND dateTime < ? ORDER BY dateTime'.format(checkIdentifier(tableName))
+            params = (startTimeEpoch, endTimeEpoch)
+        dataArray = self.getArrayFromDatabase(dbRequest, params, 5)
 
-        else: # return all points
-            dataTable = self.getFromDatabase('SELECT dateTime, {} FROM {} WHERE dateTime between {} AND {}'.format(entry, tableName, startTimeEpoch, endTimeEpoch))
-            dataArray = np.array(dataTable)
+        stepIndex, stepSums = sumSteps(edges, dataArray[:,0], dataArray[:,1:])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(stepSums[:,1] > 0, stepSums[:,0] / stepSums[:,1], stepSums[:,2] / stepSums[:,3])
 
+        return stepIndex, values
 
-        return dataArray
-          
-    def getData(self, entry, startTime, endTime, step, calcType=CalcType.MAX):
-        # Retrieve requested data from the database
+    def useColumnStore(self, entry):
+        return self.columns is not None and entry in self.columns.observations
 
-        startTimeEpoch = datetime.datetime.timestamp(startTime)
-        endTimeEpoch = datetime.datetime.timestamp(endTime)
-        
-        dataArray = None
-        tableName = None
-        times = None
-        values = None
-        steps = []
-    
-        # Get requested data for requested step
+    def getArchiveData(self, entry, startTimeEpoch, endTimeEpoch):
+        # Times and values of the archive records between the start and end times (inclusive), read
+        # from the column store when it has the entry
+        if (self.useColumnStore(entry)):
+            try:
+                with self.metrics.span('archiveData', source='columns') as span:
+                    times, values = self.columns.getRange(entry, startTimeEpoch, endTimeEpoch)
+                    span['rows'] = len(times)
+                    span['bytes'] = times.nbytes + values.nbytes
+                return times, values
+            except (OSError, ValueError, sqlite3.Error) as e: # column store is optional
+                logger.warning("Column store not available: %s", e)
+
+        dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime between ? AND ? ORDER BY dateTime'.format(checkIdentifier(entry))
+        logger.debug("%s %s", dbRequest, (startTimeEpoch, endTimeEpoch))
+        with self.metrics.span('archiveData', source='sql') as span:
+            dataArray = self.getArrayFromDatabase(dbRequest, (startTimeEpoch, endTimeEpoch), 2)
+            span['rows'] = len(dataArray)
+            span['bytes'] = dataArray.nbytes
+
+        return dataArray[:,0], dataArray[:,1]
+
+    def getArchiveColumns(self, entries, startTimeEpoch, endTimeEpoch):
+        # Times and values of several archive entries between the start and end times (inclusive)
+        # from one scan of the archive.  Each column is copied out so the results don't keep the
+        # whole scan in memory.
+        dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime between ? AND ? ORDER BY dateTime'.format(', '.join(checkIdentifier(entry) for entry in entries))
+        logger.debug("%s %s", dbRequest, (startTimeEpoch, endTimeEpoch))
+        with self.metrics.span('archiveData', source='sqlBatch') as span:
+            dataArray = self.getArrayFromDatabase(dbRequest, (startTimeEpoch, endTimeEpoch), len(entries) + 1)
+            span['rows'] = len(dataArray)
+            span['bytes'] = dataArray.nbytes
+
+        times = dataArray[:,0].copy()
+        return {entry: (times, dataArray[:,i+1].copy()) for i, entry in enumerate(entries)}
+
+    def getRollupSummary(self, entry, startTimeEpoch, endTimeEpoch, edges):
+        # Summaries (dateTime, min, max, sum, count) of the requested range from the coarsest rollup
+        # that lines up with the steps, records after the last complete rollup step are read from the
+        # archive.  Returns None if the rollups can't be used for these steps.
+        if (self.rollups is None):
+            return None
+        stepSize = self.rollups.getStepSize(entry, edges)
+        if (stepSize is None):
+            return None
+
+        try:
+            summaries, rollupEnd = self.rollups.getSummaries(entry, startTimeEpoch, endTimeEpoch, stepSize)
+        except sqlite3.Error as e: # rollups are optional
+            logger.warning("Rollup store not available: %s", e)
+            return None
+
+        latestTimes, latestValues = self.getArchiveData(entry, rollupEnd, endTimeEpoch)
+        inRange = latestTimes < endTimeEpoch
+        latestTimes = latestTimes[inRange]
+        latestValues = latestValues[inRange]
+        latest = np.column_stack((latestTimes, latestValues, latestValues, latestValues, ~np.isnan(latestValues)))
+
+        return np.concatenate((summaries, latest))
+
+    def getValueColumn(self, databaseEntry, tableName, calcType):
+        # Column of the values to aggregate.  weewx stores a day sum of 0 for days without valid
+        # values (a count of 0), these are read as NULL so every step without valid values has a
+        # NULL (NaN) sum.
+        if (tableName != "archive" and calcType == CalcType.SUM):
+            return 'CASE WHEN count > 0 THEN sum END'
+        return checkIdentifier(databaseEntry)
+
+    def getAggregateFromDatabase(self, databaseEntry, tableName, calcType, startTimeEpoch, endTimeEpoch, edges, stepSize):
+        # Calculate evenly spaced steps in the database so only one row per step is returned.  Returns
+        # the indices of the steps that contain data and their values.
+        anchor = getStepAnchor(edges, stepSize)
+        dbRequest = ('SELECT CAST((dateTime - ?) / ? AS INTEGER) AS step, {}({}) FROM {} '
+            'WHERE dateTime >= ? AND dateTime < ? GROUP BY step ORDER BY step').format(calcType.name, self.getValueColumn(databaseEntry, tableName, calcType), checkIdentifier(tableName))
+        dataArray = self.getArrayFromDatabase(dbRequest, (anchor, stepSize, startTimeEpoch, endTimeEpoch), 2)
+
+        return np.clip(dataArray[:,0].astype(int), 0, len(edges) - 2), dataArray[:,1]
+
+    def getStepInfo(self, entry, startTime, endTime, step):
+        # Table and step edges (epoch times, None for all points) to use for requested step
         if (step == PlotStep.ALL): # return all points in main database table
-            tableName = "archive"
-            timeStep = "all"
-            databaseEntry = entry
-            
-        elif (step == PlotStep.HOURLY):
-            tableName = "archive"
-            databaseEntry = entry
-            timeStep = 3600.0
-
-        elif (step == PlotStep.DAILY): # daily data is already included in database
-            tableName = "archive_day_{}".format(entry)
-            timeStep = 86400.0
-            databaseEntry = calcType.name
-
-        elif (step == PlotStep.WEEKLY):
-            tableName = "archive_day_{}".format(entry)
-            timeStep = 86400.0 * 7
-            databaseEntry = calcType.name
-        
-        elif (step == PlotStep.MONTHLY):
-            tableName = "archive_day_{}".format(entry)
-            timeStep = 86400.0 * 7 * 30
-            databaseEntry = calcType.name
-            # Generate start of month times
-            steps = [startTime]
-            while (steps[-1] + datetime.timedelta(days=monthrange(steps[-1].year, steps[-1].month)[1]) < endTime):
-                month = steps[-1].month + 1
-                year = steps[-1].year
-        
-                if (month > 12): # Check for end of year
-                    month = 1
-                    year = steps[-1].year + 1
+            return "archive", None
 
-                steps.append(datetime.datetime(year, month, 1))
-            steps = [datetime.datetime.timestamp(dt) for dt in steps]
-        
-        elif (step == PlotStep.ANNUALLY):
-            tableName = "archive_day_{}".format(entry)
-            timeStep = 86400.0 * 7 * 365
-            databaseEntry = calcType.name
-            # Generate start of year times
-            steps = [startTime]
-            while (datetime.datetime(steps[-1].year + 1, 1, 1) < endTime):
-                steps.append(datetime.datetime(steps[-1].year + 1, 1, 1))
-        
-            steps = [datetime.datetime.timestamp(dt) for dt in steps]
+        unit, count = stepUnits[step]
+        tableName = "archive_day_{}".format(entry) if usesDaySummaries(step) else "archive"
+        edges = calendarEdges(datetime.datetime.timestamp(startTime), datetime.datetime.timestamp(endTime), unit, count)
+
+        return tableName, edges
+
+    def getData(self, entry, startTime, endTime, step, calcType=CalcType.MAX, archiveData=None):
+        # Retrieve requested data from the database.  archiveData has archive records already read
+        # for the requested range (entry -> times, values), see getPlotDataMany.
+
+        startTimeEpoch = datetime.datetime.timestamp(startTime)
+        endTimeEpoch = datetime.datetime.timestamp(endTime)
         
-        # Check calculation type
-        if (calcType == CalcType.AVG):
-            dataArray = self.getAvg(entry, tableName, startTimeEpoch, endTimeEpoch)
+        tableName, edges = self.getStepInfo(entry, startTime, endTime, step)
+        databaseEntry = entry if tableName == "archive" else calcType.name
+
+        # Averages of daily data are calculated from the daily sums
+        if (calcType == CalcType.AVG and "day" in tableName):
+            stepIndex, values = self.getAvg(tableName, startTimeEpoch, endTimeEpoch, edges)
+            times = epochToLocal(edges[stepIndex])
+            return times, values
+
+        # Steps that line up with the rollups are combined from the rollup summaries
+        if (tableName == "archive" and edges is not None and calcType in (CalcType.MIN, CalcType.MAX, CalcType.SUM, CalcType.AVG)):
+            summaries = self.getRollupSummary(entry, startTimeEpoch, endTimeEpoch, edges)
+            if (summaries is not None):
+                stepIndex, stepStats = aggregateSummary(edges, summaries[:,0], *summaries[:,1:].T)
+                return epochToLocal(edges[stepIndex]), stepStats[calcType.name.lower()]
+
+        # Evenly spaced steps can be calculated by the database, other steps (e.g. months or days
+        # across a DST change) and data in the column store are calculated here
+        useColumnStore = tableName == "archive" and self.useColumnStore(entry)
+        stepSize = getUniformStep(edges) if edges is not None else None
+        if (self.sqlAggregate and stepSize is not None and not useColumnStore):
+            stepIndex, values = self.getAggregateFromDatabase(databaseEntry, tableName, calcType, startTimeEpoch, endTimeEpoch, edges, stepSize)
+            times = epochToLocal(edges[stepIndex])
+            return times, values
+
+        if (tableName == "archive" and edges is not None and not useColumnStore):
+            # Stream archive rows into the steps so only the step results are held in memory
+            dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime between ? AND ? ORDER BY dateTime'.format(checkIdentifier(entry))
+            logger.debug("%s %s", dbRequest, (startTimeEpoch, endTimeEpoch))
+            accumulator = StepAccumulator(edges)
+            with self.metrics.span('calcPlotData', calcType=calcType.name) as span:
+                for chunk in self.iterArrayFromDatabase(dbRequest, (startTimeEpoch, endTimeEpoch)):
+                    accumulator.add(chunk[:,0], chunk[:,1])
+                stepIndex, values = accumulator.result(calcType)
+                span['rows'] = int(accumulator.numRows.sum())
+            if (len(stepIndex) == 0): # no data available
+                return [], np.zeros(0)
+            return epochToLocal(edges[stepIndex]), values
+
+        if (tableName == "archive" and archiveData is not None and entry in archiveData):
+            dataTimes, dataValues = archiveData[entry]
+        elif (tableName == "archive"):
+            dataTimes, dataValues = self.getArchiveData(entry, startTimeEpoch, endTimeEpoch)
         else:
-            #dataTable = self.getFromDatabase('SELECT dateTime, {} FROM archive WHERE dateTime between {} AND {}'.format(entry, startTimeEpoch, endTimeEpoch))
-            dataTable = self.getFromDatabase('SELECT dateTime, {} FROM {} WHERE dateTime between {} AND {}'.format(databaseEntry, tableName, startTimeEpoch, endTimeEpoch))
-            print('SELECT dateTime, {} FROM {} WHERE dateTime between {} AND {}'.format(databaseEntry, tableName, startTimeEpoch, endTimeEpoch))
-            dataArray = np.array(dataTable)
+            dbRequest = 'SELECT dateTime, {} FROM {} WHERE dateTime between ? AND ? ORDER BY dateTime'.format(self.getValueColumn(databaseEntry, tableName, calcType), checkIdentifier(tableName))
+            logger.debug("%s %s", dbRequest, (startTimeEpoch, endTimeEpoch))
+            dataArray = self.getArrayFromDatabase(dbRequest, (startTimeEpoch, endTimeEpoch), 2)
+            dataTimes = dataArray[:,0]
+            dataValues = dataArray[:,1]
 
         # Check if plot data needs to be calculated
-        if (dataArray is not None):
-            if (timeStep == 'all'):
-                times = [datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M") for t in dataArray[:,0]]
-                values = dataArray[:,1]
-            else: # calculate values for each time step
-                times, values = self.calcPlotData(startTimeEpoch, endTimeEpoch, timeStep, dataArray, calcType, steps)
+        if (edges is None):
+            times = epochToLocal(dataTimes)
+            values = dataValues
+        else: # calculate values for each time step
+            times, values = self.calcPlotData(edges, dataTimes, dataValues, calcType)
         return times, values
 
+    def getDataStats(self, entry, startTime, endTime, step, stats=('min', 'max', 'avg')):
+        # Calculate several statistics for each step from a single scan of the data.  Stats can be any
+        # of min, max, sum, count, avg, std, and percentiles ('p<percent>').  Min, max, sum, count, and
+        # avg use the daily summary tables for daily and longer steps, the other stats need the raw
+        # archive data.
+        startTimeEpoch = datetime.datetime.timestamp(startTime)
+        endTimeEpoch = datetime.datetime.timestamp(endTime)
+        tableName, edges = self.getStepInfo(entry, startTime, endTime, step)
+        needsDistribution = any(stat == 'std' or stat.startswith('p') for stat in stats)
+
+        if (needsDistribution or tableName == "archive"): # raw samples
+            tableName = "archive"
+            summaryColumns = '{0}, {0}, {0}, {0} IS NOT NULL, {0}, {0} IS NOT NULL'.format(checkIdentifier(entry))
+            stepColumns = 'MIN({0}), MAX({0}), SUM({0}), COUNT({0}), SUM({0}), COUNT({0})'.format(checkIdentifier(entry))
+        else: # daily summaries, averages are time weighted
+            summaryColumns = 'min, max, sum, count, wsum, sumtime'
+            stepColumns = 'MIN(min), MAX(max), SUM(sum), SUM(count), SUM(wsum), SUM(sumtime)'
+
+        rollupSummaries = None
+        if (tableName == "archive" and edges is not None and not needsDistribution):
+            rollupSummaries = self.getRollupSummary(entry, startTimeEpoch, endTimeEpoch, edges)
+
+        if (rollupSummaries is not None): # summaries from the rollups, counts are the time weights
+            dataArray = np.column_stack((rollupSummaries, rollupSummaries[:,3:5]))
+        elif (tableName == "archive" and self.useColumnStore(entry)): # raw samples from the column store
+            dataTimes, dataValues = self.getArchiveData(entry, startTimeEpoch, endTimeEpoch)
+            isValid = ~np.isnan(dataValues)
+            dataArray = np.column_stack((dataTimes, dataValues, dataValues, dataValues, isValid, dataValues, isValid))
+        else:
+            stepSize = getUniformStep(edges) if edges is not None else None
+            if (self.sqlAggregate and stepSize is not None and not needsDistribution):
+                # Summarize evenly spaced steps in the database, the summaries are then combined into the same steps below
+                anchor = getStepAnchor(edges, stepSize)
+                dbRequest = ('SELECT ? + ? * CAST((dateTime - ?) / ? AS INTEGER) AS step, {} FROM {} '
+                    'WHERE dateTime >= ? AND dateTime < ? GROUP BY step ORDER BY step').format(stepColumns, checkIdentifier(tableName))
+                params = (anchor, stepSize, anchor, stepSize, startTimeEpoch, endTimeEpoch)
+            else:
+                dbRequest = 'SELECT dateTime, {} FROM {} WHERE dateTime between ? AND ? ORDER BY dateTime'.format(summaryColumns, checkIdentifier(tableName))
+                params = (startTimeEpoch, endTimeEpoch)
+            dataArray = self.getArrayFromDatabase(dbRequest, params, 7)
+
+        if (edges is None): # every point is its own step
+            edges = np.append(dataArray[:,0], endTimeEpoch + 1)
+
+        if (needsDistribution):
+            stepIndex, stepStats = aggregateStats(edges, dataArray[:,0], dataArray[:,1], stats)
+        else:
+            stepIndex, stepStats = aggregateSummary(edges, dataArray[:,0], *dataArray[:,1:].T)
+            stepStats = {stat: stepStats[stat] for stat in stats}
+
+        times = epochToLocal(edges[stepIndex])
+        return times, stepStats
+
     def createDataPlot(self, entry, startTime, endTime, step, calcType=CalcType.MAX, ax=None):
         startTimeEpoch = datetime.datetime.timestamp(startTime)
         endTimeEpoch = datetime.datetime.timestamp(endTime)
@@ -319,87 +1249,288 @@ class WeatherPlotter:
 
         # Format plot    
         ax.tick_params(axis='x', rotation=75)
-        ax.set_title("{} of {} - {} - {} to {}".format(calcType.name.capitalize(), capitalizeFirst(entry), step.name.capitalize(), startTime.strftime("%Y-%m-%d %H:%M"), endTime.strftime("%Y-%m-%d %H:%M")))
+        ax.set_title("{} of {} - {} - {} to {}".format(calcType.name.capitalize(), capitalizeFirst(entry), step.name.replace('_', ' ').capitalize(), startTime.strftime("%Y-%m-%d %H:%M"), endTime.strftime("%Y-%m-%d %H:%M")))
         ax.set_xlabel("Time")
         ax.set_ylabel("{} ({})".format(capitalizeFirst(entry), self.units[entry]))
 
         return ax
 
+    def getPlotDataKey(self, plotRequest):
+        # Parameters the plot data depends on, in a fixed order
+        requestType = plotRequest['type'] if plotRequest['type'] in ('tempPlot', 'rainPlot', 'stats', 'rolling', 'degreeDays', 'windRose', 'histogram') else 'standard'
+        startTime = plotRequest['startTime'].timestamp()
+        endTime = plotRequest['endTime'].timestamp()
+        if (requestType == 'rainPlot'):
+            return (requestType, startTime, endTime, plotRequest.get('maxPoints'), plotRequest.get('downsample', 'minmax'))
+        if (requestType == 'tempPlot'):
+            return (requestType, startTime, endTime, int(plotRequest['plotStep']), plotRequest.get('maxPoints'), plotRequest.get('downsample', 'minmax'))
+        if (requestType == 'stats'):
+            return (requestType, plotRequest['data_type'], startTime, endTime, int(plotRequest['plotStep']))
+        if (requestType == 'rolling'):
+            return (requestType, plotRequest['data_type'], startTime, endTime, plotRequest['operator'], plotRequest.get('window'), int(plotRequest['resetStep']), plotRequest.get('maxPoints'), plotRequest.get('downsample', 'minmax'))
+        if (requestType == 'degreeDays'):
+            return (requestType, startTime, endTime, plotRequest['kind'], plotRequest['base'], int(plotRequest['resetStep']))
+        if (requestType in ('windRose', 'histogram')):
+            return ('histogram', plotRequest['xEntry'], plotRequest['yEntry'], startTime, endTime, plotRequest['xBins'], plotRequest['yBins'])
+        return (requestType, plotRequest['data_type'], startTime, endTime, int(plotRequest['plotStep']), int(plotRequest['calcType']), plotRequest.get('maxPoints'), plotRequest.get('downsample', 'minmax'))
+
     def getPlotData(self, plotRequest):
+        # Plot data for request, shared with identical requests through the plot data cache
+        return self.getCachedPlotData(plotRequest, self.getLatestTime(), lambda: self.calcPlotRequest(plotRequest))
+
+    def getArchiveEntries(self, plotRequest):
+        # Entries a request reads as raw archive records through the database, these can be read
+        # for several requests at once
+        if (plotRequest['type'] == 'rainPlot'):
+            entries = ['rain', 'rainRate']
+        elif (plotRequest['type'] == 'standard' and plotRequest['plotStep'] == PlotStep.ALL):
+            entries = [plotRequest['data_type']]
+        else:
+            return []
+        return [entry for entry in entries if not self.useColumnStore(entry)]
+
+    def getPlotDataMany(self, plotRequests):
+        # Plot data for several requests.  Requests for raw archive records over the same time range
+        # (e.g. the current day graphs) share one scan of the archive that reads all of their
+        # entries.  The scan is only made if one of those requests is not in the plot data cache.
+        latestTime = self.getLatestTime()
+        rangeEntries = dict() # (start, end) -> entries
+        for plotRequest in plotRequests:
+            entries = self.getArchiveEntries(plotRequest)
+            if (entries):
+                timeRange = (plotRequest['startTime'].timestamp(), plotRequest['endTime'].timestamp())
+                rangeEntries.setdefault(timeRange, dict()).update(dict.fromkeys(entries))
+
+        scans = dict()
+        scanLock = Lock()
+        def getArchiveData(timeRange):
+            with scanLock:
+                if (timeRange not in scans):
+                    scans[timeRange] = self.getArchiveColumns(list(rangeEntries[timeRange]), *timeRange)
+                return scans[timeRange]
+
+        dataOut = []
+        for plotRequest in plotRequests:
+            timeRange = (plotRequest['startTime'].timestamp(), plotRequest['endTime'].timestamp())
+            if (self.getArchiveEntries(plotRequest)):
+                calcData = lambda plotRequest=plotRequest, timeRange=timeRange: self.calcPlotRequest(plotRequest, getArchiveData(timeRange))
+            else:
+                calcData = lambda plotRequest=plotRequest: self.calcPlotRequest(plotRequest)
+            dataOut.append(self.getCachedPlotData(plotRequest, latestTime, calcData))
+
+        return dataOut
+
+    def getCachedPlotData(self, plotRequest, latestTime, calcData):
+        # Plot data for request from the plot data cache, calculated by calcData if needed
+        endTime = plotRequest['endTime'].timestamp()
+
+        # Data ending before the latest archive record will not change.  Daily and longer steps (and
+        # degree days) use the day summaries, which change until the end of the day of the latest record.
+        immutable = False
+        if (latestTime is not None):
+            if (plotRequest['type'] == 'degreeDays' or (plotRequest['type'] not in ('rainPlot', 'rolling', 'windRose', 'histogram') and usesDaySummaries(plotRequest['plotStep']))):
+                latestDay = datetime.datetime.fromtimestamp(latestTime).replace(hour=0, minute=0, second=0, microsecond=0)
+                immutable = endTime < latestDay.timestamp()
+            else:
+                immutable = endTime < latestTime
+
+        with self.metrics.span('getPlotData', type=plotRequest['type']) as span:
+            data = self.plotDataCache.get(self.getPlotDataKey(plotRequest), latestTime, immutable, calcData)
+            span['rows'] = data['reduction']['points']
+            span['bytes'] = self.plotDataCache.dataSize(data)
+        dataOut = dict(plotRequest)
+        dataOut['data'] = data
+
+        return dataOut
+
+    def calcPlotRequest(self, plotRequest, archiveData=None):
+        # Calculate plot data for request, archiveData has any archive records already read (see getData)
         dataOut = None
 
+        # Long series are reduced to about maxPoints points per series
+        maxPoints = plotRequest.get('maxPoints')
+        downsample = plotRequest.get('downsample', 'minmax')
+        numPoints = [0, 0] # raw, plotted
+
+        def reduceSeries(times, values):
+            numPoints[0] += len(values)
+            if (maxPoints):
+                times, values = downsampleSeries(times, values, maxPoints, downsample)
+            numPoints[1] += len(values)
+            return times, values
+
         if (plotRequest['type'] == 'tempPlot'):
             dates, data, types = self.getTempPlotData(plotRequest['startTime'], plotRequest['endTime'], plotRequest['plotStep'])
-            dataRequest = copy.deepcopy(plotRequest)
-            dataRequest['data'] = {'dates': dates, 'data': data, 'types': types}
-            dataOut = dataRequest 
+            # Reduce min, max, and avg series separately
+            series = [reduceSeries(dates[types == seriesType], data[types == seriesType]) for seriesType in dict.fromkeys(types)]
+            types = np.concatenate([[seriesType] * len(values) for seriesType, (times, values) in zip(dict.fromkeys(types), series)])
+            dates = np.concatenate([times for times, values in series])
+            data = np.concatenate([values for times, values in series])
+            dataOut = {'dates': dates, 'data': data, 'types': types}
         elif (plotRequest['type'] == 'rainPlot'):
-            
-
-            rainPlotData = self.getRainPlotData(plotRequest['startTime'], plotRequest['endTime'])
-            dataRequest = copy.deepcopy(plotRequest)
-            dataRequest['data'] = rainPlotData
-            dataOut = dataRequest
+            rainPlotData = self.getRainPlotData(plotRequest['startTime'], plotRequest['endTime'], archiveData)
+            rainPlotData = {name: list(reduceSeries(*series)) for name, series in rainPlotData.items()}
+            dataOut = rainPlotData
+        elif (plotRequest['type'] == 'rolling'):
+            dates, data = self.getRollingData(plotRequest['data_type'], plotRequest['startTime'], plotRequest['endTime'], plotRequest['operator'], plotRequest.get('window'), plotRequest['resetStep'])
+            dates, data = reduceSeries(dates, data)
+            dataOut = {'dates': dates, 'data': data}
+        elif (plotRequest['type'] == 'degreeDays'): # one point per day, not downsampled
+            dates, daily, total = self.getDegreeDays(plotRequest['startTime'], plotRequest['endTime'], plotRequest['kind'], plotRequest['base'], plotRequest['resetStep'])
+            numPoints[0] = numPoints[1] = len(dates)
+            dataOut = {'dates': dates, 'daily': daily, 'total': total}
+        elif (plotRequest['type'] in ('windRose', 'histogram')): # counts of each bin
+            dataOut = self.getHistogram(plotRequest['xEntry'], plotRequest['yEntry'], plotRequest['startTime'].timestamp(), plotRequest['endTime'].timestamp(), plotRequest['xBins'], plotRequest['yBins'])
+            numPoints[0] = int(dataOut['counts'].sum())
+            numPoints[1] = dataOut['counts'].size
+        elif (plotRequest['type'] == 'stats'): # min, max, and avg of each step, not downsampled
+            dates, stats = self.getDataStats(plotRequest['data_type'], plotRequest['startTime'], plotRequest['endTime'], plotRequest['plotStep'], ('min', 'max', 'avg'))
+            numPoints[0] = numPoints[1] = len(dates)
+            dataOut = {'dates': dates, 'stats': stats}
         else:
-            dates, data = self.getData(plotRequest['data_type'], plotRequest['startTime'], plotRequest['endTime'], plotRequest['plotStep'], plotRequest['calcType'])
-            dataRequest = copy.deepcopy(plotRequest)
-            dataRequest['data'] = {'dates': dates, 'data': data}
-            dataOut = dataRequest 
+            dates, data = self.getData(plotRequest['data_type'], plotRequest['startTime'], plotRequest['endTime'], plotRequest['plotStep'], plotRequest['calcType'], archiveData)
+            dates, data = reduceSeries(dates, data)
+            dataOut = {'dates': dates, 'data': data}
+
+        # Report how much the data was reduced
+        dataOut['reduction'] = {'rawPoints': numPoints[0], 'points': numPoints[1], 'ratio': numPoints[0] / numPoints[1] if numPoints[1] else 1.0}
 
         return dataOut
 
+    def getObservations(self):
+        # Observation columns of the archive table
+        if (self.observations is None):
+            columns = [row[1] for row in self.getFromDatabase('PRAGMA table_info(archive)')]
+            self.observations = [column for column in columns if column not in ('dateTime', 'usUnits', 'interval')]
+        return self.observations
+
+    def iterExportData(self, plotRequest, chunkSize=8192):
+        # Data of a standard, stats, rolling, or degree day request without downsampling as chunks of (local times,
+        # {column: values}) of up to chunkSize rows.  Raw archive records (PlotStep.ALL) are streamed
+        # from a dedicated database connection so long ranges are never held in memory, a slow
+        # download doesn't hold a pooled connection, and values are exported as stored.  Stepped
+        # data comes from the plot data cache.
+        if (plotRequest['type'] == 'stats'):
+            data = self.getPlotData(plotRequest)['data']
+            times, columns = data['dates'], data['stats']
+        elif (plotRequest['type'] == 'degreeDays'):
+            data = self.getPlotData(plotRequest)['data']
+            times, columns = data['dates'], {'daily': data['daily'], 'total': data['total']}
+        elif (plotRequest['type'] == 'rolling' or plotRequest['plotStep'] != PlotStep.ALL):
+            data = self.getPlotData(dict(plotRequest, maxPoints=None))['data']
+            times, columns = data['dates'], {plotRequest['data_type']: data['data']}
+        else:
+            entry = plotRequest['data_type']
+            dbRequest = 'SELECT dateTime, {} FROM archive WHERE dateTime between ? AND ? ORDER BY dateTime'.format(checkIdentifier(entry))
+            for chunk in self.iterArrayFromDatabase(dbRequest, (plotRequest['startTime'].timestamp(), plotRequest['endTime'].timestamp()), 2, chunkSize, dedicated=True):
+                yield epochToLocal(chunk[:,0]), {entry: chunk[:,1]}
+            return
+
+        # Values calculated from the float32 column store are rounded to the digits it holds
+        if (plotRequest['type'] != 'degreeDays' and self.useColumnStore(plotRequest['data_type']) and (plotRequest['type'] == 'rolling' or not usesDaySummaries(plotRequest['plotStep']))):
+            columns = {name: roundFloat32(values) for name, values in columns.items()}
+
+        for start in range(0, len(times), chunkSize):
+            yield times[start:start + chunkSize], {name: values[start:start + chunkSize] for name, values in columns.items()}
+
     def getGraph(self, plotRequest):
         # Get graph data and create graph            
-        graphData = self.getPlotData(plotRequest)
+        return self.timeGraph(self.getPlotData(plotRequest))
+
+    def getGraphs(self, plotRequests):
+        # Graphs of several requests, with the plot data read together (see getPlotDataMany)
+        return [self.timeGraph(graphData) for graphData in self.getPlotDataMany(plotRequests)]
 
-        return self.createGraph(graphData)
+    def timeGraph(self, graphData):
+        with self.metrics.span('createGraph', type=graphData['type']) as span:
+            fig = self.createGraph(graphData)
+            span['rows'] = graphData['data']['reduction']['points']
+
+        return fig
+
+    def addNormals(self, fig, entry, startTime, endTime):
+        # Normal range (mean daily low to high) and records of each day behind the data of a figure
+        if (self.climatology is None):
+            return
+        try:
+            normals = self.climatology.getNormals(entry, startTime, endTime)
+        except (OSError, ValueError, sqlite3.Error) as e: # climatology is optional
+            logger.warning("Climatology not available: %s", e)
+            return
+        if (normals is None):
+            return
+
+        days, stats = normals
+        times = getFigureTimes(days)
+        numTraces = len(fig.data)
+        fig.add_trace(go.Scatter(x=times, y=stats['low'], name='Normal Low', mode='lines', line={'width': 0}, showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=times, y=stats['high'], name='Normal Range', mode='lines', line={'width': 0}, fill='tonexty', fillcolor='rgba(128, 128, 128, 0.25)',
+            customdata=stats['low'], hovertemplate='%{customdata:.1f} to %{y:.1f}'))
+        for name, values, years in (('Record High', stats['recordHigh'], stats['recordHighYear']), ('Record Low', stats['recordLow'], stats['recordLowYear'])):
+            fig.add_trace(go.Scatter(x=times, y=values, name=name, mode='lines', line={'width': 1, 'dash': 'dot'}, customdata=years, hovertemplate='%{y:.1f} (%{customdata:.0f})'))
+        fig.data = fig.data[numTraces:] + fig.data[:numTraces] # drawn behind the data
 
     def createGraph(self, graphData):
         if (graphData == None):
             return {}
         
         if (graphData['type'] == 'tempPlot'):
-            df = pd.DataFrame({
-                "dates": graphData['data']['dates'],
-                graphData['data_type']: graphData['data']['data'],
-                "types": graphData['data']['types']})
-            title = "Temperature Summary Plot - {} - {} to {}".format(graphData['plotStep'].name.capitalize(), graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
-            fig = px.scatter(df, x="dates", y=graphData['data_type'], color="types", title=title)
+            # One trace each for min, max, and avg
+            data = graphData['data']
+            series = [(str(seriesType), data['dates'][data['types'] == seriesType], data['data'][data['types'] == seriesType]) for seriesType in dict.fromkeys(data['types'])]
+            title = "Temperature Summary Plot - {} - {} to {}".format(graphData['plotStep'].name.replace('_', ' ').capitalize(), graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
             yaxis_title = "{} ({})".format(graphData['data_type'], self.units[graphData['data_type']])
-            fig.update_layout(xaxis_title='Date', yaxis_title=yaxis_title, legend_title='')
+            fig = createFigure(series, title, yaxis_title, showlegend=True)
+            self.addNormals(fig, graphData['data_type'], graphData['startTime'], graphData['endTime'])
 
         elif (graphData['type'] == 'rainPlot'):
-            fig = make_subplots()
-        #return {'rainSum': [times, rainSumValues], 'rainRate': [times, rainRateValues]}
-            #df = pd.DataFrame({
-            #    "dates": graphData['dates'],
-            #    graphData['data_type']: graphData['data']})
-           
-            fig.add_trace(go.Scatter(x=graphData['data']['rainSum'][0], y=graphData['data']['rainSum'][1], name='Rain Total', mode='markers'))
-            fig.add_trace(go.Scatter(x=graphData['data']['rainRate'][0], y=graphData['data']['rainRate'][1], name='Rain Rate', mode='markers'))
-            
-
-            #fig = px.scatter(df, x="dates", y=graphData['data_type'], title=title)
+            series = [('Rain Total',) + tuple(graphData['data']['rainSum']), ('Rain Rate',) + tuple(graphData['data']['rainRate'])]
             title = "Rain Summary Plot - {} to {}".format(graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
             yaxis_title = "{}/{} ({}/{})".format('Rain Total', 'Rain Rate', self.units['rain'], self.units['rainRate'])
-            fig.update_layout(xaxis_title='Date',yaxis_title=yaxis_title)
+            fig = createFigure(series, title, yaxis_title, showlegend=True)
+
+        elif (graphData['type'] == 'rolling'):
+            series = [(graphData['data_type'], graphData['data']['dates'], graphData['data']['data'])]
+            calcName = "Running Total" if graphData['operator'] == 'cumsum' else "Rolling {} {}".format(formatWindow(graphData['window']), graphData['operator'].capitalize())
+            resetName = "" if graphData['resetStep'] == PlotStep.ALL else " - Restarting {}".format(graphData['resetStep'].name.replace('_', ' ').capitalize())
+            title = "{} of {}{} - {} to {}".format(calcName, capitalizeFirst(graphData['data_type']), resetName, graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
+            yaxis_title = "{} ({})".format(graphData['data_type'], self.units[graphData['data_type']])
+            fig = createFigure(series, title, yaxis_title, showlegend=False)
+
+        elif (graphData['type'] == 'degreeDays'):
+            data = graphData['data']
+            series = [('Daily', data['dates'], data['daily']), ('Total', data['dates'], data['total'])]
+            resetName = "" if graphData['resetStep'] == PlotStep.ALL else " - Restarting {}".format(graphData['resetStep'].name.replace('_', ' ').capitalize())
+            title = "{} Degree Days (Base {:g}){} - {} to {}".format(graphData['kind'].capitalize(), graphData['base'], resetName, graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
+            yaxis_title = "Degree Days ({})".format(self.units['outTemp'])
+            fig = createFigure(series, title, yaxis_title, showlegend=True)
+
+        elif (graphData['type'] == 'windRose'):
+            title = "Wind Rose - {} to {}".format(graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
+            fig = createWindRoseFigure(graphData['data'], graphData['xBins'], graphData['yBins'], title, self.units.get(graphData['yEntry'], ''))
+
+        elif (graphData['type'] == 'histogram'):
+            title = "{} vs {} - {} to {}".format(capitalizeFirst(graphData['yEntry']), capitalizeFirst(graphData['xEntry']), graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
+            axisTitles = ["{} ({})".format(entry, self.units[entry]) if entry in self.units else entry for entry in (graphData['xEntry'], graphData['yEntry'])]
+            fig = createHeatmapFigure(graphData['data'], graphData['xBins'], graphData['yBins'], title, *axisTitles)
 
         else: # standard
-            df = pd.DataFrame({
-                "dates": graphData['data']['dates'],
-                graphData['data_type']: graphData['data']['data']})
-            title = "{} of {} - {} - {} to {}".format(graphData['calcType'].name.capitalize(), capitalizeFirst(graphData['data_type']), graphData['plotStep'].name.capitalize(), graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
-            fig = px.scatter(df, x="dates", y=graphData['data_type'], title=title)
+            series = [(graphData['data_type'], graphData['data']['dates'], graphData['data']['data'])]
+            title = "{} of {} - {} - {} to {}".format(graphData['calcType'].name.capitalize(), capitalizeFirst(graphData['data_type']), graphData['plotStep'].name.replace('_', ' ').capitalize(), graphData['startTime'].strftime("%Y-%m-%d %H:%M"), graphData['endTime'].strftime("%Y-%m-%d %H:%M"))
             yaxis_title = "{} ({})".format(graphData['data_type'], self.units[graphData['data_type']])
-            fig.update_layout(xaxis_title='Date',yaxis_title=yaxis_title)
+            fig = createFigure(series, title, yaxis_title, showlegend=False)
 
         return fig
 
 
 class WeatherPlotThread(Thread):
-   
-    def __init__(self, weatherPlotter, inQueue, outQueue):
-        super().__init__()
+    # Plot request service.  Requests run on a bounded pool of worker threads (numpy and sqlite
+    # release the GIL for the heavy work) and are returned as futures keyed by request id.
+    # Identical requests in flight share one computation, and a new request from a client
+    # supersedes the client's previous one.  Requests put on inQueue are submitted by the thread and
+    # their results are put on outQueue with the request id.
+    def __init__(self, weatherPlotter, inQueue, outQueue, maxWorkers=4):
+        super().__init__(daemon=True)
 
         # WeatherPlotter object
         self.weatherPlot = weatherPlotter
@@ -408,45 +1539,121 @@ class WeatherPlotThread(Thread):
         self.inQueue = inQueue
         self.outQueue = outQueue
 
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="wxPlot")
+        self.lock = RLock() # future callbacks may run while held
+        self.inFlight = dict() # request key -> [shared future, number of waiting requests]
+        self.requests = dict() # request id -> (request key, future returned to caller)
+        self.clientRequests = dict() # client id -> request id of latest request
+
         self.stopThread = False
 
-    def run(self):
-        # Open database connection
-        #conn = sqlite3.connect(self.weatherPlot.dbPath)
-        #self.weatherPlot.dbCursor = conn.cursor()
+    def requestKey(self, plotRequest, createFigure):
+        # Requests with the same parameters (other than ids) give the same result
+        return (createFigure,) + tuple(sorted((key, repr(value)) for key, value in plotRequest.items() if key not in ('requestId', 'clientId')))
+
+    def runRequest(self, plotRequest, createFigure):
+        if (createFigure):
+            return self.weatherPlot.getGraph(plotRequest)
+        return self.weatherPlot.getPlotData(plotRequest)
+
+    def submit(self, plotRequest, clientId=None, createFigure=False):
+        # Submit plot request and return its request id and a future of the plot data (or figure).
+        # The future is cancelled if the same client submits another request before it completes.
+        requestId = plotRequest.get('requestId') or uuid.uuid4().hex
+        key = self.requestKey(plotRequest, createFigure)
+        future = Future()
+
+        with self.lock:
+            if (clientId is not None and self.clientRequests.get(clientId) in self.requests):
+                self.releaseRequest(self.clientRequests[clientId])
+
+            if (key in self.inFlight): # join identical request already in progress
+                self.inFlight[key][1] += 1
+                shared = self.inFlight[key][0]
+            else:
+                shared = self.executor.submit(self.runRequest, plotRequest, createFigure)
+                self.inFlight[key] = [shared, 1]
+                # Registered last, a computation that already finished runs the callback now, which
+                # removes the entry
+                shared.add_done_callback(lambda shared, key=key: self.sharedDone(key, shared))
+            self.requests[requestId] = (key, future)
+            if (clientId is not None):
+                self.clientRequests[clientId] = requestId
+
+        shared.add_done_callback(lambda shared: self.copyResult(shared, future))
+        future.add_done_callback(lambda future: self.requestDone(requestId, clientId))
+
+        return requestId, future
+
+    def getFuture(self, requestId):
+        with self.lock:
+            request = self.requests.get(requestId)
+        return request[1] if request is not None else None
+
+    def cancel(self, requestId):
+        # Cancel request, the computation is stopped if no other request is waiting on it
+        with self.lock:
+            if (requestId in self.requests):
+                self.releaseRequest(requestId)
+
+    def releaseRequest(self, requestId):
+        # Called with lock held
+        key, future = self.requests.pop(requestId)
+        future.cancel()
+        if (key in self.inFlight):
+            self.inFlight[key][1] -= 1
+            if (self.inFlight[key][1] <= 0): # nobody waiting, drop if not started yet
+                shared = self.inFlight.pop(key)[0]
+                shared.cancel()
+
+    def sharedDone(self, key, shared):
+        with self.lock:
+            if (key in self.inFlight and self.inFlight[key][0] is shared):
+                del self.inFlight[key]
+
+    def copyResult(self, shared, future):
+        # Requests are cancelled with the lock held, so a request that isn't done here can't be
+        # cancelled before its result is set
+        with self.lock:
+            if (future.done()): # request was already cancelled
+                return
+            if (shared.cancelled()):
+                future.cancel()
+            elif (shared.exception() is not None):
+                future.set_exception(shared.exception())
+            else:
+                future.set_result(shared.result())
+
+    def requestDone(self, requestId, clientId):
+        with self.lock:
+            self.requests.pop(requestId, None)
+            if (clientId is not None and self.clientRequests.get(clientId) == requestId):
+                del self.clientRequests[clientId]
+
+    def stop(self):
+        self.stopThread = True
+        self.inQueue.put(None) # wake thread
+        self.executor.shutdown(wait=False)
 
-        curCondCheckInt = 30.0 # seconds
-        lastCurCondCheck = 0.0
+    def run(self):
+        # Submit queued plot requests and output their results with the request id
         while (self.stopThread == False):
-            dataOut = {'current': None, 'dataRequest': None}
-            # Check for incoming plot requests
-            if (self.inQueue.empty() == False):
-                plotRequest = self.inQueue.get()
-                if (plotRequest['type'] == 'tempPlot'):
-                    dates, data, types = self.weatherPlot.getTempPlotData(plotRequest['startTime'], plotRequest['endTime'], plotRequest['plotStep'])
-                    dataRequest = copy.deepcopy(plotRequest)
-                    dataRequest['dates'] = dates
-                    dataRequest['data'] = data
-                    dataRequest['types'] = types
-                    dataOut['dataRequest'] = dataRequest 
-                else:
-                    dates, data = self.weatherPlot.getData(plotRequest['data_type'], plotRequest['startTime'], plotRequest['endTime'], plotRequest['plotStep'], plotRequest['calcType'])
-                    dataRequest = copy.deepcopy(plotRequest)
-                    dataRequest.update({'type': 'standard', 'dates': dates, 'data': data})
-                    dataOut['dataRequest'] = dataRequest 
-                    
-            # Get current conditions
-            #if (time.time() > (lastCurCondCheck + curCondCheckInt)): 
-            #    dataOut['current'] = self.weatherPlot.getCurrentWeather() 
-            #    lastCurCondCheck = time.time()       
- 
-            # Output plot request data
-            #if (dataOut['current'] != None or dataOut['dataRequest'] != None):
-            if (dataOut['dataRequest'] != None):
-                self.outQueue.put(dataOut)
-
-
-            time.sleep(1.0)
+            plotRequest = self.inQueue.get()
+            if (plotRequest is None):
+                continue
+
+            requestId, future = self.submit(plotRequest, plotRequest.get('clientId'))
+            future.add_done_callback(lambda future, requestId=requestId: self.outputResult(requestId, future))
+
+    def outputResult(self, requestId, future):
+        if (future.cancelled()): # superseded
+            return
+        dataOut = {'requestId': requestId, 'current': None, 'dataRequest': None, 'error': None}
+        try:
+            dataOut['dataRequest'] = future.result()
+        except Exception as error:
+            dataOut['error'] = error
+        self.outQueue.put(dataOut)
 
 
 if (__name__ == '__main__'):
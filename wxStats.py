@@ -8,97 +8,115 @@ import pandas as pd
 import datetime
 import sqlite3
 import numpy as np
-from weatherStats import PlotStep, CalcType, WeatherPlotter, DataCalculation, WeatherPlotThread
+from weatherStats import PlotStep, CalcType, WeatherPlotter, DataCalculation, WeatherPlotThread, FigureCache, epochToLocal, getFigureTimes, rollingCalcTypes
+from weatherExport import exportFormats, formatAvailable, iterExport
+from weatherHistogram import cardinalDirection, directionBins, valueBins
 from calendar import monthrange
-import math, time
+import math, time, os
 from queue import Queue
+from concurrent.futures import CancelledError
+import uuid, logging
+import flask
 #from users import VALID_USERNAME_PASSWORD_PAIRS # uncomment to enable simple user authentication
 
 def capitalizeFirst(strIn):
     return strIn[0].upper() + strIn[1:]
 
 def get_current_weather():
-    weatherPlot.getCurrentWeather()
+    currentConditions = weatherPlot.getCurrentWeather()
 
     # Convert wind direction to cardinal direction
-    windDir = weatherPlot.currentConditions['wind']['dir']
-    if (windDir == None):
-        windDir = '--'
-    elif (windDir > 0 and (windDir <= 11.25 or windDir > 348.75)):
-        windDir = "N"
-    elif (windDir > 11.25 and windDir <= 33.75):
-        windDir = "NNE"
-    elif (windDir > 33.75 and windDir <= 56.25):
-        windDir = "NE"
-    elif (windDir > 56.25 and windDir <= 78.75):
-        windDir = "ENE"
-    elif (windDir > 78.75 and windDir <= 101.25):
-        windDir = "E"
-    elif (windDir > 101.25 and windDir <= 123.75):
-        windDir = "ESE"
-    elif (windDir > 123.75 and windDir <= 146.25):
-        windDir = "SE"
-    elif (windDir > 146.25 and windDir <= 168.75):
-        windDir = "SSE"
-    elif (windDir > 168.75 and windDir <= 191.25):
-        windDir = "S"
-    elif (windDir > 191.25 and windDir <= 213.75):
-        windDir = "SSW"
-    elif (windDir > 213.75 and windDir <= 236.25):
-        windDir = "SW"
-    elif (windDir > 236.25 and windDir <= 258.75):
-        windDir = "WSW"
-    elif (windDir > 258.75 and windDir <= 281.25):
-        windDir = "W"
-    elif (windDir > 281.25 and windDir <= 303.75):
-        windDir = "WNW"
-    elif (windDir > 303.75 and windDir <= 326.25):
-        windDir = "NW"
-    elif (windDir > 326.25 and windDir <= 191.25):
-        windDir = "NNW"
+    windDir = currentConditions['wind']['dir']
+    windDir = '--' if windDir is None else cardinalDirection(windDir)
 
     
-    return ["{} {}".format(weatherPlot.currentConditions['time'].strftime("%Y-%m-%d %H:%M:%S"), time.tzname[time.daylight]), 
-        "{:.1f} {}F".format(weatherPlot.currentConditions['outTemp']['current'], u'\N{DEGREE SIGN}'),
-        "{}%".format(int(weatherPlot.currentConditions['humidity'])),
-        "{:.2f} in".format(weatherPlot.currentConditions['rain']['sum']),
-        "{:.2f} in/hr".format(weatherPlot.currentConditions['rain']['rainRate']),
-        "{:.1f} mph".format(weatherPlot.currentConditions['wind']['speed']),
+    def format_value(formatString, value): # missing values are shown as '--'
+        return formatString.format(value) if value is not None else '--'
+
+    return ["{} {}".format(currentConditions['time'].strftime("%Y-%m-%d %H:%M:%S"), time.tzname[time.daylight]), 
+        format_value("{:.1f} " + u'\N{DEGREE SIGN}' + "F", currentConditions['outTemp']['current']),
+        format_value("{:.0f}%", currentConditions['humidity']),
+        format_value("{:.2f} in", currentConditions['rain']['sum']),
+        format_value("{:.2f} in/hr", currentConditions['rain']['rainRate']),
+        format_value("{:.1f} mph", currentConditions['wind']['speed']),
         "{}".format(windDir),
-        "{:.1f} mph".format(weatherPlot.currentConditions['wind']['gust'])
+        format_value("{:.1f} mph", currentConditions['wind']['gust'])
     ]
 
 # Weather plotter
-path = "/home/weewx/archive/weewx.sdb" 
+path = os.environ.get("WXDASH_DB", "/home/weewx/archive/weewx.sdb") # WXDASH_DB selects another database (e.g. for weatherBench.py)
 units = {"outTemp": "{}F".format(u'\N{DEGREE SIGN}'), "rain": "in", "rainRate": "in/hr", "windSpeed": 'mph'}
-weatherPlot = WeatherPlotter(path, units)
+rollupPath = os.path.join(os.path.dirname(path), "weewx_rollup.sdb") # hourly summaries, weewx.sdb is not modified
+columnDir = os.path.join(os.path.dirname(path), "weewx_columns") # memory mapped archive columns shared by all server processes
+climatePath = os.path.join(os.path.dirname(path), "weewx_climatology.npz") # day of year normals and records shown on the temperature stats graph
+slowTime = None # seconds, log requests slower than this (with query plans of slow database requests)
+snapshotDir = os.environ.get("WXDASH_SNAPSHOT_DIR") # local directory (e.g. /dev/shm/wxdash) to read a snapshot of the database from instead of the database weewx writes
+weatherPlot = WeatherPlotter(path, units, rollupPath=rollupPath, columnDir=columnDir, slowTime=slowTime, snapshotDir=snapshotDir, climatePath=climatePath)
 
 inQueue = Queue()
 outQueue = Queue() 
+plotThread = WeatherPlotThread(weatherPlot, inQueue, outQueue) # custom graphs are computed on its worker pool
+plotThread.start()
+
+# Custom graphs with more points than this are downsampled (about two points per pixel column)
+maxPoints = 2000
+
+# Base temperature of degree day graphs
+degreeDayBase = 65.0 # deg F
+
+# Window of rolling graphs when none (or an invalid one) is given
+defaultWindow = 86400.0 # seconds
+
+# Wind speed bins of wind roses, the last bin has all faster speeds
+windRoseSpeeds = (0, 1, 4, 8, 13, 19, 25, np.inf) # mph
+
+# Current weather graphs are shared by all page loads until a new archive record is written
+figureCache = FigureCache()
+
+def create_current_graph(plotRequest, graph):
+    yaxis_title = "{} ({})".format(plotRequest['data_type'], weatherPlot.units[plotRequest['data_type']])
+    graph.update_layout(xaxis_title="Date", yaxis_title=yaxis_title)
+
+    return graph
 
 # User authentication
 #auth = dash_auth.BasicAuth(app, VALID_USERNAME_PASSWORD_PAIRS) # uncomment to enable simple user authentication
 
 # App layout and initialization function
+def create_current_graphs():
+    # Current day graphs up to the latest archive record and the live update state of a page
+    # showing them (day, time of last record sent, and rain total)
+    now = datetime.datetime.now()
+    startTime = datetime.datetime(now.year, now.month, now.day, 0, 0, 0)
+    latestTime = weatherPlot.getLatestTime()
+    if (latestTime is None): # no data
+        endTime = now
+    else:
+        endTime = datetime.datetime.fromtimestamp(max(latestTime, startTime.timestamp()))
+    plotRequests = [{'type': "standard", 'data_type': 'outTemp', 'startTime': startTime, 'endTime': endTime, 'plotStep': PlotStep.ALL, 'calcType': CalcType.AVG},
+        {'type': "rainPlot", 'data_type': 'rain', 'startTime': startTime, 'endTime': endTime},
+        {'type': "standard", 'data_type': 'windSpeed', 'startTime': startTime, 'endTime': endTime, 'plotStep': PlotStep.ALL, 'calcType': CalcType.AVG}]
+
+    # The first graph not in the figure cache builds all of them from one scan of the archive
+    graphs = []
+    def get_graph(index):
+        if (not graphs):
+            graphs.extend(weatherPlot.getGraphs(plotRequests))
+        return create_current_graph(plotRequests[index], graphs[index])
+
+    curTempGraph = figureCache.get(('cur-temp-graph', startTime.date()), latestTime, lambda: get_graph(0))
+    curRainGraph = figureCache.get(('cur-rain-graph', startTime.date()), latestTime, lambda: get_graph(1))
+    curWindGraph = figureCache.get(('cur-wind-graph', startTime.date()), latestTime, lambda: get_graph(2))
+
+    liveState = {'day': startTime.date().isoformat(), 'lastTime': endTime.timestamp(), 'rainSum': weatherPlot.getArchiveSum('rain', startTime.timestamp(), endTime.timestamp())}
+
+    return [curTempGraph, curRainGraph, curWindGraph], liveState
+
 def serve_layout():
     endTime = datetime.datetime.now()
     
     # Get current weather conditions
-    startTime = datetime.datetime(endTime.year, endTime.month, endTime.day, 0, 0, 0)
-    curTempGraph = weatherPlot.getGraph({'type': "standard", 'data_type': 'outTemp', 'startTime': startTime, 'endTime': endTime, 'plotStep': PlotStep.ALL, 'calcType': CalcType.AVG})
-    #curTempGraph = weatherPlot.getGraph(graphData)
-    yaxis_title = "{} ({})".format('outTemp', weatherPlot.units['outTemp'])
-    curTempGraph.update_layout(xaxis_title="Date", yaxis_title=yaxis_title)
-    #graphData = weatherPlot.getPlotData({'type': "standard", 'data_type': 'rain', 'startTime': startTime, 'endTime': endTime, 'plotStep': PlotStep.ALL, 'calcType': CalcType.AVG})
-    curRainGraph = weatherPlot.getGraph({'type': "rainPlot", 'data_type': 'rain', 'startTime': startTime, 'endTime': endTime})
-    #graphData = weatherPlot.getRainPlotData(startTime, endTime)
-    #curRainGraph = weatherPlot.getGraph(graphData)
-    yaxis_title = "{} ({})".format('rain', weatherPlot.units['rain'])
-    curRainGraph.update_layout(xaxis_title="Date", yaxis_title=yaxis_title)
-    curWindGraph = weatherPlot.getGraph({'type': "standard", 'data_type': 'windSpeed', 'startTime': startTime, 'endTime': endTime, 'plotStep': PlotStep.ALL, 'calcType': CalcType.AVG})
-    #curWindGraph = weatherPlot.getGraph(graphData)
-    yaxis_title = "{} ({})".format('windSpeed', weatherPlot.units['windSpeed'])
-    curWindGraph.update_layout(xaxis_title="Date", yaxis_title=yaxis_title)
+    (curTempGraph, curRainGraph, curWindGraph), liveState = create_current_graphs()
     currentConditions = get_current_weather()
 
     # Layout app
@@ -148,7 +166,8 @@ def serve_layout():
     dcc.Interval( # current weather update interval
         id='cur-weather-interval',
         interval=60*1000 # milliseconds
-    )
+    ),
+    dcc.Store(id='live-state', data=liveState) # last record shown by the current weather graphs
     #]),
     #], style={'width':"100%"}),
     #], style={'display': 'inline-block'}),
@@ -247,11 +266,36 @@ def serve_layout():
                     {'label': 'AVG', 'value': 'AVG'},
                     {'label': 'SUM', 'value': 'SUM'},
                     {'label': 'STATS', 'value': 'STATS'},
+                    {'label': 'RUNNING TOTAL', 'value': 'CUMSUM'},
+                    {'label': 'ROLLING SUM', 'value': 'ROLLING_SUM'},
+                    {'label': 'ROLLING AVG', 'value': 'ROLLING_MEAN'},
+                    {'label': 'ROLLING MIN', 'value': 'ROLLING_MIN'},
+                    {'label': 'ROLLING MAX', 'value': 'ROLLING_MAX'},
+                    {'label': 'HEATING DEGREE DAYS', 'value': 'HEATING_DEGREE_DAYS'},
+                    {'label': 'COOLING DEGREE DAYS', 'value': 'COOLING_DEGREE_DAYS'},
+                    {'label': 'WIND ROSE', 'value': 'WIND_ROSE'},
                 ],
                 value='MIN'
        )], className='column_label')
     ], className='row'),
 
+    html.Div([
+        html.Div("Rolling Window:", className='column_label'),
+        html.Div(children=[
+            dcc.Dropdown(
+                id='window-drop',
+                options=[
+                    {'label': '1 HOUR', 'value': 3600},
+                    {'label': '3 HOURS', 'value': 3 * 3600},
+                    {'label': '24 HOURS', 'value': 86400},
+                    {'label': '7 DAYS', 'value': 7 * 86400},
+                    {'label': '30 DAYS', 'value': 30 * 86400},
+                ],
+                value=86400,
+                clearable=False
+       )], className='column_label')
+    ], className='row'),
+
     html.Div([
         html.Div("Plot Step:", className='column_label'),
         html.Div(children=[
@@ -259,17 +303,22 @@ def serve_layout():
                 id='plot-step-drop',
                 options=[
                     {'label': 'ALL', 'value': 'ALL'},
+                    {'label': '5 MINUTE', 'value': 'FIVE_MINUTE'},
+                    {'label': '15 MINUTE', 'value': 'FIFTEEN_MINUTE'},
                     {'label': 'HOURLY', 'value': 'HOURLY'},
+                    {'label': '3 HOURLY', 'value': 'THREE_HOURLY'},
                     {'label': 'DAILY', 'value': 'DAILY'},
                     {'label': 'WEEKLY', 'value': 'WEEKLY'},
                     {'label': 'MONTHLY', 'value': 'MONTHLY'},
+                    {'label': 'QUARTERLY', 'value': 'QUARTERLY'},
+                    {'label': 'SEASONALLY', 'value': 'SEASONALLY'},
                     {'label': 'ANNUALLY', 'value': 'ANNUALLY'},
                 ],
                 value='ALL'
        )], className='column_label')
     ], className='row'),
    
-    html.P(children='Usage Notes: Calculation Type input is not used if Plot Step is ALL. STATS calculation type is only applicable to temperature plots.'),
+    html.P(children='Usage Notes: Calculation Type input is not used if Plot Step is ALL. STATS calculation type is only applicable to temperature plots. Running totals, rolling calculations, and degree day totals restart at each Plot Step (ALL never restarts). Rolling Window is only used by the rolling calculation types, degree days are always temperature.'),
     html.Button('Generate', id='generate-val', n_clicks=0),
     
     #html.Label('Output'),
@@ -290,7 +339,8 @@ def serve_layout():
     #    interval=5*1000 # milliseconds
     #),
 
-    html.Div(id="dummy-div", style={'display': 'none'})
+    html.Div(id="dummy-div", style={'display': 'none'}),
+    dcc.Store(id='client-id', data=uuid.uuid4().hex) # identifies this page so a new graph request replaces the previous one
     #], style={'width':"100%"}),
     ], style={'display': 'inline-block'})
 
@@ -300,6 +350,70 @@ def serve_layout():
 app = dash.Dash(__name__, title="Weather Dashboard", requests_pathname_prefix='/wx/')
 app.layout = serve_layout
 
+# Request timing, exported with the plotter timing spans in Prometheus format
+@app.server.before_request
+def start_request_timer():
+    flask.g.requestStart = time.perf_counter()
+
+@app.server.after_request
+def record_request_time(response):
+    if ('requestStart' in flask.g):
+        labels = {'endpoint': flask.request.endpoint or ''}
+        if (flask.request.endpoint and flask.request.endpoint.endswith('_dash-update-component')):
+            labels['output'] = (flask.request.get_json(silent=True) or {}).get('output', '')
+        span = {'bytes': response.calculate_content_length()}
+        weatherPlot.metrics.observe('http', time.perf_counter() - flask.g.requestStart, span, **labels)
+    return response
+
+@app.server.route(app.config.routes_pathname_prefix + 'metrics') # /wx/metrics behind the proxy
+def metrics():
+    return flask.Response(weatherPlot.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.server.route(app.config.routes_pathname_prefix + 'export') # /wx/export behind the proxy
+def export():
+    # Data of a graph request without downsampling, e.g.
+    # /wx/export?data_type=outTemp&start=2021-01-01T00:00:00&end=2022-01-01T00:00:00&step=DAILY&calc=MAX&format=csv
+    # Steps and calculations are the PlotStep and CalcType names, STATS exports the min, max, and
+    # avg of each step.  Rolling calculations take the window in seconds (window=86400).  Formats
+    # are csv, parquet, and arrow (Arrow IPC stream).
+    args = flask.request.args
+    try:
+        data_type = args['data_type']
+        startTime = datetime.datetime.fromisoformat(args['start'])
+        endTime = datetime.datetime.fromisoformat(args['end'])
+        plotStep = PlotStep[args.get('step', 'ALL').upper()]
+        calcType = CalcType[args.get('calc', 'AVG').upper()]
+        exportFormat = args.get('format', 'csv').lower()
+        window = float(args.get('window', defaultWindow))
+    except (KeyError, ValueError) as e:
+        flask.abort(400, "Invalid export request: {}".format(e))
+    if (not math.isfinite(window) or window <= 0):
+        flask.abort(400, "Invalid window: {}".format(window))
+    if (data_type not in weatherPlot.getObservations()):
+        flask.abort(400, "Unknown data type: {}".format(data_type))
+    if (calcType == CalcType.WIND_ROSE):
+        flask.abort(400, "Wind roses can't be exported")
+    if (exportFormat not in exportFormats):
+        flask.abort(400, "Unknown format: {}".format(exportFormat))
+    if (not formatAvailable(exportFormat)):
+        flask.abort(501, "{} export needs pyarrow".format(exportFormat))
+
+    plotRequest = get_derived_request(data_type, startTime, endTime, plotStep, calcType, window)
+    if (plotRequest is not None):
+        columnNames = ['daily', 'total'] if plotRequest['type'] == 'degreeDays' else [data_type]
+    elif (calcType == CalcType.STATS):
+        plotRequest = {'type': "stats", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep}
+        columnNames = ['min', 'max', 'avg']
+    else:
+        plotRequest = {'type': "standard", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep, 'calcType': calcType}
+        columnNames = [data_type]
+
+    mimetype, extension = exportFormats[exportFormat]
+    fileName = "{}_{}_{}_{}_{}.{}".format(data_type, calcType.name.lower(), plotStep.name.lower(), startTime.strftime("%Y%m%d%H%M"), endTime.strftime("%Y%m%d%H%M"), extension)
+    chunks = weatherPlot.iterExportData(plotRequest)
+    return flask.Response(flask.stream_with_context(iterExport(chunks, columnNames, exportFormat)), mimetype=mimetype,
+        headers={'Content-Disposition': 'attachment; filename="{}"'.format(fileName)})
+
 # Callbacks
 #@app.callback([dash.dependencies.Output('cur-time-div', 'children'),
 #    dash.dependencies.Output('cur-temp-div', 'children'),
@@ -319,6 +433,47 @@ app.layout = serve_layout
 #    [dash.dependencies.Input('graph-interval', 'n_intervals')])
 
 
+@app.callback([dash.dependencies.Output('cur-temp-graph', 'extendData'),
+    dash.dependencies.Output('cur-rain-graph', 'extendData'),
+    dash.dependencies.Output('cur-wind-graph', 'extendData'),
+    dash.dependencies.Output('cur-temp-graph', 'figure'),
+    dash.dependencies.Output('cur-rain-graph', 'figure'),
+    dash.dependencies.Output('cur-wind-graph', 'figure'),
+    dash.dependencies.Output('cur-time-div', 'children'),
+    dash.dependencies.Output('cur-temp-div', 'children'),
+    dash.dependencies.Output('cur-hum-div', 'children'),
+    dash.dependencies.Output('cur-rain-tot-div', 'children'),
+    dash.dependencies.Output('cur-rain-rate-div', 'children'),
+    dash.dependencies.Output('cur-wind-speed-div', 'children'),
+    dash.dependencies.Output('cur-wind-dir-div', 'children'),
+    dash.dependencies.Output('cur-wind-gust-div', 'children'),
+    dash.dependencies.Output('live-state', 'data')],
+    [dash.dependencies.Input('cur-weather-interval', 'n_intervals')],
+    [dash.dependencies.State('live-state', 'data')])
+def update_current_weather(n_intervals, live_state):
+    # Append archive records written since the last update to the current weather graphs
+    with weatherPlot.metrics.span('callback', callback='update_current_weather'):
+        if (live_state is None or datetime.date.today().isoformat() != live_state['day']): # new day, start graphs over
+            figures, live_state = create_current_graphs()
+            return [dash.no_update] * 3 + figures + get_current_weather() + [live_state]
+
+        times, records = weatherPlot.getNewRecords(['outTemp', 'rain', 'rainRate', 'windSpeed'], live_state['lastTime'])
+        if (len(times) == 0):
+            raise dash.exceptions.PreventUpdate
+
+        def toList(values): # JSON values, NULL as None
+            return [None if math.isnan(value) else float(value) for value in values]
+
+        plotTimes = getFigureTimes(epochToLocal(times)).tolist()
+        rainSums = live_state['rainSum'] + np.cumsum(np.nan_to_num(records['rain']))
+        tempData = [{'x': [plotTimes], 'y': [toList(records['outTemp'])]}, [0]]
+        rainData = [{'x': [plotTimes, plotTimes], 'y': [toList(rainSums), toList(records['rainRate'])]}, [0, 1]]
+        windData = [{'x': [plotTimes], 'y': [toList(records['windSpeed'])]}, [0]]
+        live_state = dict(live_state, lastTime=float(times[-1]), rainSum=float(rainSums[-1]))
+
+        return [tempData, rainData, windData] + [dash.no_update] * 3 + get_current_weather() + [live_state]
+
+
 @app.callback(dash.dependencies.Output('wx-graph', 'figure'),
 #@app.callback(dash.dependencies.Output('graph-update-signal', 'children'),
 #@app.callback(dash.dependencies.Output('wx-graph', 'figure'),
@@ -329,12 +484,47 @@ app.layout = serve_layout
     [dash.dependencies.State('start-time-in', 'value')],
     [dash.dependencies.State('end-time-in', 'value')],
     [dash.dependencies.State('calc-type-drop', 'value')],
-    [dash.dependencies.State('plot-step-drop', 'value')])
-def update_graph(n_clicks, start_date, end_date, data_type, start_time, end_time, calc_type, plot_step):
+    [dash.dependencies.State('plot-step-drop', 'value')],
+    [dash.dependencies.State('window-drop', 'value')],
+    [dash.dependencies.State('client-id', 'data')])
+def update_graph(n_clicks, start_date, end_date, data_type, start_time, end_time, calc_type, plot_step, window, client_id):
     #global figOrig
     if (n_clicks == 0): # Ignore if button not clicked
         return {}
+
+    try:
+        with weatherPlot.metrics.span('callback', callback='update_graph'):
+            fig = create_custom_graph(start_date, end_date, data_type, start_time, end_time, calc_type, plot_step, client_id, window)
+    except CancelledError: # superseded by a newer request from this page
+        raise dash.exceptions.PreventUpdate
+    #if (fig != None):
+    #    figOrig = fig
     
+    return fig
+    #return "Now updated {}, {}, {}, {}, {}".format(data_type, start_time, end_time, calc_step, plot_step)
+
+def getWindow(window):
+    # Rolling window in seconds
+    try:
+        window = float(window)
+    except (TypeError, ValueError):
+        return defaultWindow
+    return window if math.isfinite(window) and window > 0 else defaultWindow
+
+def get_derived_request(data_type, startTime, endTime, plotStep, calcType, window=defaultWindow):
+    # Plot request of the running total, rolling, and degree day calculation types (None for other
+    # types).  These restart at each plot step boundary, PlotStep.ALL never restarts.  A missing or
+    # invalid window falls back to defaultWindow.
+    if (calcType == CalcType.CUMSUM):
+        return {'type': "rolling", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'operator': 'cumsum', 'resetStep': plotStep, 'maxPoints': maxPoints}
+    if (calcType in rollingCalcTypes):
+        return {'type': "rolling", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'operator': rollingCalcTypes[calcType], 'window': getWindow(window), 'resetStep': plotStep, 'maxPoints': maxPoints}
+    if (calcType in (CalcType.HEATING_DEGREE_DAYS, CalcType.COOLING_DEGREE_DAYS)):
+        kind = 'heating' if calcType == CalcType.HEATING_DEGREE_DAYS else 'cooling'
+        return {'type': "degreeDays", 'data_type': 'outTemp', 'startTime': startTime, 'endTime': endTime, 'kind': kind, 'base': degreeDayBase, 'resetStep': plotStep}
+    return None
+
+def create_custom_graph(start_date, end_date, data_type, start_time, end_time, calc_type, plot_step, client_id=None, window=defaultWindow):
     # Get inputs
     startTime = datetime.datetime.strptime("{} {}".format(start_date, start_time), "%Y-%m-%d %H:%M:%S")
     endTime = datetime.datetime.strptime("{} {}".format(end_date, end_time), "%Y-%m-%d %H:%M:%S")
@@ -345,8 +535,13 @@ def update_graph(n_clicks, start_date, end_date, data_type, start_time, end_time
     #conn = sqlite3.connect(path)
     #dbCursor = conn.cursor()
 
-    if (data_type == 'outTemp' and calcType == CalcType.STATS): # temperature stats plot
-        graphData = weatherPlot.getPlotData({'type': "tempPlot", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep})
+    derivedRequest = get_derived_request(data_type, startTime, endTime, plotStep, calcType, window)
+    if (derivedRequest is not None): # running total, rolling, or degree day plot
+        plotRequest = derivedRequest
+    elif (calcType == CalcType.WIND_ROSE): # wind direction and speed of the whole range, any data type
+        plotRequest = {'type': "windRose", 'xEntry': 'windDir', 'yEntry': 'windSpeed', 'startTime': startTime, 'endTime': endTime, 'xBins': directionBins(16), 'yBins': valueBins(windRoseSpeeds)}
+    elif (data_type == 'outTemp' and calcType == CalcType.STATS): # temperature stats plot
+        plotRequest = {'type': "tempPlot", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep, 'maxPoints': maxPoints}
         #inQueue.put({'type': "tempPlot", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep})
         
         #dates, data, types = createTempPlot(dbCursor, startTime, endTime, plotStep)
@@ -357,7 +552,7 @@ def update_graph(n_clicks, start_date, end_date, data_type, start_time, end_time
         #title = "Temperature Summary Plot - {} - {} to {}".format(plotStep.name.capitalize(), startTime.strftime("%Y-%m-%d %H:%M"), endTime.strftime("%Y-%m-%d %H:%M"))
         #fig = px.scatter(df, x="dates", y=data_type, color="types", title=title)
     else:
-        graphData = weatherPlot.getPlotData({'type': "standard", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep, 'calcType': calcType})
+        plotRequest = {'type': "standard", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep, 'calcType': calcType, 'maxPoints': maxPoints}
         #inQueue.put({'type': "standard", 'data_type': data_type, 'startTime': startTime, 'endTime': endTime, 'plotStep': plotStep, 'calcType': calcType})
         #dates, data = getData(dbCursor, data_type, startTime, endTime, plotStep, calcType)
         #df = pd.DataFrame({
@@ -367,15 +562,13 @@ def update_graph(n_clicks, start_date, end_date, data_type, start_time, end_time
         #fig = px.scatter(df, x="dates", y=data_type, title=title)
 
 
-    # Get new graph
-    fig = weatherPlot.getGraph(graphData)
-    #if (fig != None):
-    #    figOrig = fig
-    
-    return fig
-    #return "Now updated {}, {}, {}, {}, {}".format(data_type, start_time, end_time, calc_step, plot_step)
+    # Get new graph from the plot workers
+    requestId, future = plotThread.submit(plotRequest, clientId=client_id, createFigure=True)
+
+    return future.result()
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     path = "/mnt/weewx/archive/weewx.sdb" 
 
     # Create plotter